@@ -0,0 +1,55 @@
+"""
+Compares the columnar Avro serializer with the pandavro row by row path
+on a DataFrame shaped like the test catalog user_events data set.
+
+    python benchmarks/avro_serializer.py
+"""
+import io
+import timeit
+
+import numpy as np
+import pandas as pd
+import pandavro
+
+from intake_dal import avro_columnar
+
+
+SCHEMA = {
+    "fields": [
+        {"name": "userid", "type": "long"},
+        {"name": "home_id", "type": "int"},
+        {"name": "action", "type": ["string"]},
+        {"name": "timestamp", "type": ["null", {"logicalType": "timestamp-millis", "type": "long"}]},
+    ],
+    "name": "Root",
+    "type": "record",
+}
+
+
+def pandavro_serialize(df: pd.DataFrame) -> bytes:
+    with io.BytesIO() as bytes_io:
+        pandavro.to_avro(bytes_io, df.replace({np.nan: None}), schema=SCHEMA)
+        return bytes_io.getvalue()
+
+
+def main():
+    for rows in [1000, 10000, 100000]:
+        df = pd.DataFrame(
+            {
+                "userid": np.arange(rows),
+                "home_id": np.arange(rows, dtype=np.int32),
+                "action": np.random.choice(["click", "home_view", "save"], rows).astype(object),
+                "timestamp": pd.date_range("2019-08-12", periods=rows, freq="s"),
+            }
+        )
+        number = max(1, 100000 // rows)
+        pandavro_time = timeit.timeit(lambda: pandavro_serialize(df), number=number) / number
+        columnar_time = timeit.timeit(lambda: avro_columnar.serialize(df, SCHEMA), number=number) / number
+        print(
+            f"rows={rows:>6} pandavro={pandavro_time * 1000:8.2f}ms "
+            f"columnar={columnar_time * 1000:8.2f}ms speedup={pandavro_time / columnar_time:5.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+"""
+Measures the construction of a DalSource and of its storage mode source, for one key
+of the key value storage modes as request serving code does it, on the test catalog.
+
+    python benchmarks/source_construction.py
+"""
+import timeit
+from pathlib import Path
+
+from intake_dal.dal_catalog import DalCatalog
+
+
+CATALOG_PATH = Path(__file__).parent.parent / "intake_dal" / "tests" / "catalog.yaml"
+
+
+def main():
+    cat = DalCatalog(str(CATALOG_PATH))
+    number = 2000
+    for storage_mode, key in [("in_mem", 42), ("serving", 42), ("batch", None)]:
+        kwargs = {"storage_mode": storage_mode, "key": key} if key else {"storage_mode": storage_mode}
+        cat.entity.user.user_events(**kwargs)._get_source()
+
+        sources = [cat.entity.user.user_events(**kwargs) for _ in range(number)]
+        entry_time = timeit.timeit(lambda: cat.entity.user.user_events(**kwargs), number=number) / number
+        sources_iter = iter(sources)
+        source_time = timeit.timeit(lambda: next(sources_iter)._get_source(), number=number) / number
+        print(
+            f"storage_mode={storage_mode:<8} DalSource={entry_time * 1e6:8.1f}us "
+            f"storage mode source={source_time * 1e6:8.1f}us"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+"""
+Columnar pandas DataFrame to Avro object container serializer.
+
+It encodes whole columns at a time from their NumPy arrays instead of converting
+the DataFrame to a list of row dicts, and produces the same bytes as
+pandavro.to_avro(df.replace({np.nan: None})) given the same sync marker.
+
+Only flat records of null, boolean, int, long, float, double, string and
+timestamp-millis/micros longs, optionally in a union with null, are supported.
+Anything else raises UnsupportedAvroSchema so the caller can fall back to pandavro.
+"""
+import io
+import os
+from typing import Dict, List, Optional, Tuple, Union
+
+import fastavro
+import numpy as np
+import pandas as pd
+
+
+# fastavro defaults
+SYNC_SIZE = 16
+SYNC_INTERVAL = 1000 * SYNC_SIZE
+
+INT_MIN_VALUE = -(1 << 31)
+INT_MAX_VALUE = (1 << 31) - 1
+LONG_MAX_VALUE = (1 << 63) - 1
+
+# encoded bytes of a column, the bytes of all the rows in row order and the length of each row,
+# flat buffers instead of padded rows keep the memory proportional to the encoded size
+Piece = Tuple[np.ndarray, np.ndarray]
+
+
+class UnsupportedAvroSchema(ValueError):
+    """ The schema or the DataFrame column types are not supported by the columnar serializer. """
+
+
+def serialize(df: pd.DataFrame, schema: Dict, sync_marker: Optional[bytes] = None) -> bytes:
+    """
+    :param df: DataFrame with a column per schema field
+    :param schema: Avro record schema
+    :param sync_marker: 16 bytes, a random one by default like fastavro
+    :return: Avro object container bytes
+    """
+    if schema.get("type") != "record":
+        raise UnsupportedAvroSchema(f"only record schemas are supported: {schema}")
+
+    sync_marker = sync_marker or os.urandom(SYNC_SIZE)
+    pieces: List[Piece] = []
+    for field in schema["fields"]:
+        if field["name"] not in df:
+            raise UnsupportedAvroSchema(f"missing column {field['name']}")
+        pieces.extend(_encode_field(df[field["name"]], field["type"]))
+
+    with io.BytesIO() as bytes_io:
+        # empty writer, just the header
+        fastavro.writer(bytes_io, schema, [], codec="null", sync_marker=sync_marker)
+        if len(df) > 0:
+            data, row_lengths = _concat_pieces(pieces)
+            _write_blocks(bytes_io, data.tobytes(), row_lengths, sync_marker)
+        return bytes_io.getvalue()
+
+
+def _encode_field(series: pd.Series, avro_type: Union[str, list, dict]) -> List[Piece]:
+    null_mask = series.isnull().values
+    if isinstance(avro_type, list):
+        branches = [t for t in avro_type if t != "null"]
+        if len(branches) != 1 or len(avro_type) > 2:
+            raise UnsupportedAvroSchema(f"only unions of a type and null are supported: {avro_type}")
+        if "null" in avro_type:
+            index = np.where(null_mask, avro_type.index("null"), avro_type.index(branches[0]))
+        elif null_mask.any():
+            raise UnsupportedAvroSchema(f"{series.name} has nulls but {avro_type} is not nullable")
+        else:
+            index = np.full(len(series), avro_type.index(branches[0]))
+        return [_encode_long(index), _encode_value(series, branches[0], null_mask)]
+
+    if null_mask.any():
+        raise UnsupportedAvroSchema(f"{series.name} has nulls but {avro_type} is not nullable")
+    return [_encode_value(series, avro_type, null_mask)]
+
+
+def _encode_value(series: pd.Series, avro_type: Union[str, dict], null_mask: np.ndarray) -> Piece:
+    """ Encodes the non null values, null rows are left empty. """
+    if isinstance(avro_type, dict):
+        logical_type = avro_type.get("logicalType")
+        if avro_type.get("type") == "long" and logical_type in ("timestamp-millis", "timestamp-micros"):
+            return _encode_timestamp(series, logical_type, null_mask)
+        elif set(avro_type.keys()) != {"type"}:
+            raise UnsupportedAvroSchema(f"{avro_type} not supported")
+        avro_type = avro_type["type"]
+
+    kind = series.dtype.kind
+    if avro_type in ("int", "long") and kind in "iu":
+        return _encode_integers(series, avro_type)
+    elif avro_type in ("float", "double") and kind == "f":
+        values = series.values.astype("<f4" if avro_type == "float" else "<f8")
+        return _mask_nulls(_fixed_width(values), null_mask)
+    elif avro_type == "boolean" and kind == "b":
+        return _fixed_width(series.values.astype(np.uint8))
+    elif avro_type == "string" and kind == "O":
+        return _encode_strings(series, null_mask)
+    else:
+        raise UnsupportedAvroSchema(f"{series.name} of dtype {series.dtype} not supported as {avro_type}")
+
+
+def _encode_integers(series: pd.Series, avro_type: str) -> Piece:
+    # compared as uint64, mixed with a signed int the values would be compared as floats
+    if series.dtype == np.uint64 and len(series) and series.values.max() > np.uint64(LONG_MAX_VALUE):
+        raise UnsupportedAvroSchema(f"{series.name} values out of the long range")
+    values = series.values.astype(np.int64)
+    if avro_type == "int" and len(values) and (values.min() < INT_MIN_VALUE or values.max() > INT_MAX_VALUE):
+        raise UnsupportedAvroSchema(f"{series.name} values out of the int range")
+    return _encode_long(values)
+
+
+def _fixed_width(values: np.ndarray) -> Piece:
+    piece_bytes = np.ascontiguousarray(values).view(np.uint8).ravel()
+    return piece_bytes, np.full(len(values), values.dtype.itemsize, dtype=np.int64)
+
+
+def _mask_nulls(piece: Piece, null_mask: np.ndarray) -> Piece:
+    """ Drops the bytes of the null rows. """
+    piece_bytes, piece_lengths = piece
+    if not null_mask.any():
+        return piece
+    return piece_bytes[np.repeat(~null_mask, piece_lengths)], np.where(null_mask, 0, piece_lengths)
+
+
+def _encode_long(values: np.ndarray) -> Piece:
+    """ Avro zig-zag variable length encoding of int and long. """
+    values = np.asarray(values, dtype=np.int64)
+    zigzag = ((values << 1) ^ (values >> 63)).view(np.uint64)
+    piece_bytes = np.zeros((len(values), 10), dtype=np.uint8)
+    piece_lengths = np.ones(len(values), dtype=np.int64)
+    for i in range(10):
+        low = (zigzag & np.uint64(0x7F)).astype(np.uint8)
+        zigzag = zigzag >> np.uint64(7)
+        more = zigzag != 0
+        piece_bytes[:, i] = low | (more.astype(np.uint8) << np.uint8(7))
+        if not more.any():
+            break
+        piece_lengths += more
+    # at most 10 bytes per row, boolean indexing walks the matrix row by row
+    return piece_bytes[np.arange(piece_bytes.shape[1]) < piece_lengths[:, None]], piece_lengths
+
+
+def _encode_strings(series: pd.Series, null_mask: np.ndarray) -> Piece:
+    values = series.values
+    if not all(isinstance(v, str) for v in values[~null_mask]):
+        raise UnsupportedAvroSchema(f"{series.name} has non string values")
+
+    encoded = [b"" if null else v.encode("utf-8") for v, null in zip(values, null_mask)]
+    lengths = np.fromiter(map(len, encoded), dtype=np.int64, count=len(encoded))
+    prefix = _mask_nulls(_encode_long(lengths), null_mask)
+    return _concat_pieces([prefix, (np.frombuffer(b"".join(encoded), dtype=np.uint8), lengths)])
+
+
+def _encode_timestamp(series: pd.Series, logical_type: str, null_mask: np.ndarray) -> Piece:
+    if series.dtype.kind != "M" or getattr(series.dtype, "tz", None) is not None:
+        raise UnsupportedAvroSchema(f"{series.name} of dtype {series.dtype} not supported as {logical_type}")
+
+    # fastavro writes int(Timestamp.timestamp() * 1000) and pandas Timestamp.timestamp()
+    # of naive timestamps is round(nanoseconds / 1e9, 6) seconds since epoch in UTC
+    seconds = _round_microseconds(np.where(null_mask, 0, series.values.view(np.int64)) / 1e9)
+    values = seconds * (1000.0 if logical_type == "timestamp-millis" else 1e6)
+    return _mask_nulls(_encode_long(values.astype(np.int64)), null_mask)
+
+
+def _round_microseconds(seconds: np.ndarray) -> np.ndarray:
+    """ Same as Python's round(s, 6) for each s in seconds. """
+    scaled = seconds * 1e6
+    rounded = np.round(scaled) / 1e6
+    # numpy and Python can only disagree on ties, which Python rounds on the exact decimal value
+    ties = np.flatnonzero(np.abs(scaled - np.floor(scaled) - 0.5) < 1e-3)
+    rounded[ties] = [round(s, 6) for s in seconds[ties].tolist()]
+    return rounded
+
+
+def _concat_pieces(pieces: List[Piece]) -> Piece:
+    """ :return: the bytes of all the rows in row order, each row being its pieces in order, and the row lengths """
+    lengths = np.column_stack([piece_lengths for _, piece_lengths in pieces])
+    row_lengths = lengths.sum(axis=1)
+    if len(pieces) == 1:
+        return pieces[0][0], row_lengths
+
+    # where each piece of each row starts in the output
+    flat_lengths = lengths.ravel()
+    starts = (np.cumsum(flat_lengths) - flat_lengths).reshape(lengths.shape)
+    data = np.empty(int(row_lengths.sum()), dtype=np.uint8)
+    for i, (piece_bytes, piece_lengths) in enumerate(pieces):
+        piece_starts = np.cumsum(piece_lengths) - piece_lengths
+        # each byte moves by the offset of its row piece
+        positions = np.repeat(starts[:, i] - piece_starts, piece_lengths)
+        positions += np.arange(len(piece_bytes))
+        data[positions] = piece_bytes
+    return data, row_lengths
+
+
+def _write_blocks(bytes_io: io.BytesIO, data: bytes, row_lengths: np.ndarray, sync_marker: bytes):
+    """ Same blocks as fastavro: a block is flushed once it reaches SYNC_INTERVAL bytes. """
+    ends = np.cumsum(row_lengths)
+    start_row, start_byte = 0, 0
+    while start_row < len(row_lengths):
+        # first row that makes the block reach the sync interval, or the last row
+        end_row = min(int(np.searchsorted(ends, start_byte + SYNC_INTERVAL)), len(row_lengths) - 1)
+        end_byte = int(ends[end_row])
+        block_header, _ = _encode_long([end_row + 1 - start_row, end_byte - start_byte])
+        bytes_io.write(block_header.tobytes())
+        bytes_io.write(data[start_byte:end_byte])
+        bytes_io.write(sync_marker)
+        start_row, start_byte = end_row + 1, end_byte
@@ -0,0 +1,70 @@
+import threading
+from typing import Iterator, Optional
+
+import pandas as pd
+
+
+class AdaptiveChunkSizer:
+    """
+    Grows or shrinks the number of rows per write chunk from the observed
+    Avro payload size and serialize + post latency of the previous chunks.
+
+    The next chunk size is the largest one that keeps both the estimated payload under
+    target_bytes and the estimated latency under target_milliseconds, bounded by
+    [min_size, max_size] and by at most doubling from one chunk to the next.
+    """
+
+    # weight of the latest observation in the moving averages
+    SMOOTHING = 0.5
+
+    def __init__(
+        self,
+        initial_size: int,
+        min_size: int = 1,
+        max_size: int = 100000,
+        target_bytes: Optional[int] = 1024 * 1024,
+        target_milliseconds: Optional[float] = None,
+    ):
+        if not 0 < min_size <= max_size:
+            raise ValueError(f"expected 0 < min_size <= max_size, got {min_size} and {max_size}")
+        self.min_size = min_size
+        self.max_size = max_size
+        self.target_bytes = target_bytes
+        self.target_milliseconds = target_milliseconds
+        self._size = self._clamp(initial_size)
+        self._bytes_per_row: Optional[float] = None
+        self._seconds_per_row: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def _clamp(self, size: float) -> int:
+        return int(max(self.min_size, min(self.max_size, size)))
+
+    def _smooth(self, average: Optional[float], value: float) -> float:
+        return value if average is None else self.SMOOTHING * value + (1 - self.SMOOTHING) * average
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def observe(self, rows: int, payload_bytes: int, avro_time: float, post_time: float):
+        """ Records the measurements of one posted chunk and updates the next chunk size. """
+        if rows <= 0:
+            return
+        with self._lock:
+            self._bytes_per_row = self._smooth(self._bytes_per_row, payload_bytes / rows)
+            self._seconds_per_row = self._smooth(self._seconds_per_row, (avro_time + post_time) / rows)
+
+            candidates = [self._size * 2]
+            if self.target_bytes and self._bytes_per_row > 0:
+                candidates.append(self.target_bytes / self._bytes_per_row)
+            if self.target_milliseconds and self._seconds_per_row > 0:
+                candidates.append(self.target_milliseconds / 1000 / self._seconds_per_row)
+            self._size = self._clamp(min(candidates))
+
+    def iter_chunks(self, df: pd.DataFrame) -> Iterator[pd.DataFrame]:
+        """ Lazily slices df using the chunk size current at the time each chunk is requested. """
+        offset = 0
+        while offset < len(df):
+            size = self.size
+            yield df.iloc[offset:offset + size]
+            offset += size
@@ -1,14 +1,24 @@
 import functools
+import hashlib
+import os
+from collections.abc import MutableMapping
+from pathlib import Path
+from typing import Dict, Iterator, Optional, Set, Tuple
 
 import pkg_resources
 import yaml
 from intake import Catalog
+from intake.catalog.entry import CatalogEntry
+from intake.catalog.exceptions import CatalogException, ValidationError
+from intake.catalog.local import CatalogParser
 from intake.utils import yaml_load
 from intake_nested_yaml_catalog.nested_yaml_catalog import (
+    NestedCatalogEntry,
     NestedYAMLFileCatalog,
 )
 
-from intake_dal.dal_source import DalSource
+from intake_dal import json_cache
+from intake_dal.dal_source import DalSource, SchemaRegistry
 
 
 class DalCatalog(NestedYAMLFileCatalog):
@@ -20,7 +30,7 @@ class DalCatalog(NestedYAMLFileCatalog):
     name = "dal_cat"
     version = pkg_resources.get_distribution("intake-dal").version
 
-    def __init__(self, path, storage_mode=None, autoreload=True, **kwargs):
+    def __init__(self, path, storage_mode=None, autoreload=True, parse_cache_dir=None, **kwargs):
         """
         Parameters
         ----------
@@ -32,6 +42,10 @@ class DalCatalog(NestedYAMLFileCatalog):
         storage_mode: str
             The dal default storage mode override for this instantiation of the
             catalog.
+        parse_cache_dir: str
+            Optional directory caching the parsed YAML by file content hash and
+            storage_mode, so the following loads of an unchanged catalog skip
+            YAML parsing.
 
         Example catalog:
           sources:
@@ -47,28 +61,147 @@ class DalCatalog(NestedYAMLFileCatalog):
         Following overrides the default from 'local' to 'serving'.
         >>> cat = DalCatalog(path, storage_mode="serving")
         >>> df = cat.user_events.read()
+
+        Autoreload only reads the file again when its mtime, size or inode changed, only parses
+        it again when its content hash changed, and only rebuilds the nested catalogs whose YAML
+        changed.
         """
         self.storage_mode = storage_mode
+        self.parse_cache_dir = parse_cache_dir
+        self._file_signature: Optional[Tuple[int, int, int]] = None
+        self._text_hash: Optional[str] = None
+        self._data: Optional[dict] = None
+        self._root_entry: Optional[NestedCatalogEntry] = None
+        # canonical names of all the nested catalogs and sources, and the entries looked up by them
+        self._canonical_names: Optional[Set[str]] = None
+        self._datasets: Dict[str, CatalogEntry] = {}
+        self.schema_registry = SchemaRegistry()
         super(DalCatalog, self).__init__(path, autoreload, **kwargs)
 
     def __getitem__(self, key):
         # TODO(Taleb Zeghmi): Remove once https://github.com/zillow/intake-nested-yaml-catalog/issues/6 is resolved
-        if len(key.split(".")) > 1:
-            return self._construct_dataset(key, self)
+        if isinstance(key, str) and len(key.split(".")) > 1:
+            return self._get_dataset(key)
         else:
             ret = super().__getitem__(key)
             return ret
 
+    def _get_dataset(self, canonical_name: str) -> CatalogEntry:
+        """ A dict lookup once canonical_name was resolved, unknown names fail without building entries. """
+        self.reload()
+        entry = self._datasets.get(canonical_name)
+        if entry is None:
+            if self._canonical_names is not None and canonical_name not in self._canonical_names:
+                raise KeyError(canonical_name)
+            entry = self._construct_dataset(canonical_name, self)
+            self._datasets[canonical_name] = entry
+        return entry
+
+    def _load(self, reload=False):
+        if not (self.autoreload or reload):
+            return
+        signature = _file_signature(self.path)
+        if signature is not None and signature == self._file_signature:
+            return
+        super()._load(reload=True)
+        self._file_signature = signature
+
     def parse(self, text):
+        text_hash = _text_hash(text)
+        if text_hash == self._text_hash:
+            return
+
+        self.text = text
+        self.schema_registry.invalidate()
+        data = self._load_data(text, text_hash)
+        if data is None:
+            raise CatalogException("No YAML data in file")
+
+        if "sources" in data or not data.get("metadata", {}).get("hierarchical_catalog"):
+            # flat catalogs go through the default NestedYAMLFileCatalog YAML parser
+            super().parse(yaml.dump(data, default_flow_style=False))
+            self._data, self._root_entry, self._text_hash = None, None, text_hash
+            self._canonical_names, self._datasets = None, {}
+            return
+
+        # Hand the parsed YAML of a hierarchical catalog straight to the nested catalog builder,
+        # reusing the nested catalogs of the previous parse whose YAML did not change
+        entry = self._create_nested_catalog(self.name, data, self._data, self._root_entry)
+        # metadata from a previous parse is replaced, metadata passed by the caller is kept
+        if not self.metadata or (self._root_entry is not None and self.metadata is self._root_entry.metadata):
+            self.metadata = entry.metadata
+        self._data, self._root_entry, self._text_hash = data, entry, text_hash
+        self._canonical_names, self._datasets = _canonical_names(data), {}
+        self._entries = entry.entries
+        self.name = entry.name or self.name_from_path
+        self.description = self.description or entry.description
+
+    def _load_data(self, text: str, text_hash: str) -> Optional[dict]:
+        """ :return: the YAML data with the dal default storage mode applied, from the parse cache if possible """
+        cache_path = None
+        if self.parse_cache_dir:
+            key = _text_hash(f"{DalCatalog.version}:{self.storage_mode}:{text_hash}")
+            cache_path = Path(self.parse_cache_dir).expanduser() / f"{key}.json"
+            data = json_cache.read_entry(cache_path)
+            if data is not None:
+                return data
+
         data = yaml_load(text)
+        if isinstance(data, dict):
+            # modify sources default storage mode
+            self._set_dal_default_storage_mode(data)
+            if cache_path is not None:
+                _write_parse_cache(cache_path, data)
+        return data
+
+    def _create_nested_catalog(
+        self,
+        name: str,
+        nested_yaml_cat: dict,
+        previous_yaml_cat: Optional[dict] = None,
+        previous_entry: Optional[NestedCatalogEntry] = None,
+    ) -> NestedCatalogEntry:
+        """
+        Creates the nested catalog entry of nested_yaml_cat, its entries are only built on first access.
+        The entries of previous_entry, created from previous_yaml_cat, are reused where the YAML is the
+        same.  A change to a level's own sources or metadata drops its whole subtree since nested
+        sources inherit from it.
+        """
+        if previous_entry is not None and nested_yaml_cat == previous_yaml_cat:
+            _reset_default_sources(previous_entry)
+            return previous_entry
+
+        level, _ = _split_nested_level(nested_yaml_cat)
+        if previous_entry is None or level != _split_nested_level(previous_yaml_cat)[0]:
+            previous_yaml_cat, previous_entry = None, None
 
-        # modify sources default storage mode
-        self._set_dal_default_storage_mode(data)
-        transformed_text = yaml.dump(data, default_flow_style=False)
+        # validates the level and registers its plugins, its sources are parsed when accessed
+        parsed_catalog = self._parse_catalog_level(
+            {k: v for k, v in level.items() if not _is_source(v)}
+        )
+        return NestedCatalogEntry(
+            entries=LazyCatalogEntries(
+                self, nested_yaml_cat, previous_yaml_cat, previous_entry.entries if previous_entry else None
+            ),
+            name=name or parsed_catalog.data.get("name"),
+            metadata=parsed_catalog.data.get("metadata", {}),
+            description=parsed_catalog.data.get("description", None),
+        )
 
-        # Reuse default NestedYAMLFileCatalog YAML parser
-        # parse() does the heavy lifting of populating the catalog
-        super().parse(transformed_text)
+    def _parse_source(self, name: str, source: dict) -> CatalogEntry:
+        # CatalogParser pops keys out of the source
+        return self._parse_catalog_level({"sources": {name: dict(source)}}).data["data_sources"][0]
+
+    def _parse_catalog_level(self, level: dict) -> CatalogParser:
+        parsed_catalog = CatalogParser(
+            {"sources": {}, **level}, context=dict(root=self._dir), getenv=self.getenv, getshell=self.getshell
+        )
+        if parsed_catalog.errors:
+            raise ValidationError(
+                "Catalog '{}' has validation errors:\n\n{}".format(self.path, "\n".join(parsed_catalog.errors)),
+                parsed_catalog.errors,
+            )
+        return parsed_catalog
 
     def _set_dal_default_storage_mode(self, data):
         """
@@ -86,3 +219,138 @@ class DalCatalog(NestedYAMLFileCatalog):
     def _construct_dataset(canonical_name: str, catalog: Catalog) -> DalSource:
         catalog_entity = functools.reduce(lambda acc, x: acc[x], canonical_name.split("."), catalog)
         return catalog_entity
+
+
+# keys of a nested catalog level that are not sources nor nested catalogs, see NestedYAMLFileCatalog
+CATALOG_FIELDS = ("metadata", "plugins", "args", "cache")
+
+
+class LazyCatalogEntries(MutableMapping):
+    """
+    Entries of a nested catalog level built from its YAML on first access, nested catalogs
+    as NestedCatalogEntry and sources one at a time by intake's CatalogParser.
+    """
+
+    def __init__(
+        self,
+        catalog: "DalCatalog",
+        nested_yaml_cat: dict,
+        previous_yaml_cat: Optional[dict] = None,
+        previous_entries: Optional["LazyCatalogEntries"] = None,
+    ):
+        level, children = _split_nested_level(nested_yaml_cat)
+        self._catalog = catalog
+        self._children = children
+        # same order as NestedYAMLFileCatalog: nested catalogs first, then sources
+        self._specs = {**children, **{k: v for k, v in level.items() if _is_source(v)}}
+        self._entries: Dict[str, CatalogEntry] = {}
+        # only what was already built is worth reusing
+        self._previous_yaml_cat = previous_yaml_cat or {}
+        self._previous_entries = previous_entries.built_entries() if previous_entries is not None else {}
+
+    def built_entries(self) -> Dict[str, CatalogEntry]:
+        return dict(self._entries)
+
+    def __getitem__(self, key: str) -> CatalogEntry:
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = self._build(key, self._specs[key])
+            self._entries[key] = entry
+        return entry
+
+    def _build(self, key: str, spec: dict) -> CatalogEntry:
+        previous_entry = self._previous_entries.pop(key, None)
+        previous_spec = self._previous_yaml_cat.get(key)
+        if key in self._children:
+            return self._catalog._create_nested_catalog(key, spec, previous_spec, previous_entry)
+        if previous_entry is not None and spec == previous_spec:
+            _reset_default_sources(previous_entry)
+            return previous_entry
+        return self._catalog._parse_source(key, spec)
+
+    def __setitem__(self, key: str, entry: CatalogEntry):
+        self._specs[key] = None
+        self._entries[key] = entry
+
+    def __delitem__(self, key: str):
+        del self._specs[key]
+        self._entries.pop(key, None)
+
+    def __contains__(self, key) -> bool:
+        return key in self._specs
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._specs)
+
+    def __len__(self) -> int:
+        return len(self._specs)
+
+    def __dask_tokenize__(self) -> str:
+        return _text_hash(repr(self._specs))
+
+
+def _is_source(value) -> bool:
+    return isinstance(value, dict) and "driver" in value
+
+
+def _split_nested_level(nested_yaml_cat: dict) -> Tuple[dict, Dict[str, dict]]:
+    """ :return: the level's own sources and fields, and its nested catalogs """
+    level, children = {}, {}
+    for k, v in nested_yaml_cat.items():
+        if k not in CATALOG_FIELDS and isinstance(v, dict) and not _is_source(v):
+            children[k] = v
+        else:
+            level[k] = v
+    return level, children
+
+
+def _canonical_names(nested_yaml_cat: dict) -> Set[str]:
+    names: Set[str] = set()
+    levels = [("", nested_yaml_cat)]
+    while levels:
+        prefix, level_yaml_cat = levels.pop()
+        level, children = _split_nested_level(level_yaml_cat)
+        names.update(prefix + k for k, v in level.items() if _is_source(v))
+        for k, v in children.items():
+            names.add(prefix + k)
+            levels.append((f"{prefix}{k}.", v))
+    return names
+
+
+def _reset_default_sources(entry: CatalogEntry):
+    """ Drops the instantiated sources of a reused entry so they are recreated under the new parents. """
+    entry._default_source = None
+    if isinstance(entry, NestedCatalogEntry) and isinstance(entry.entries, LazyCatalogEntries):
+        for child in entry.entries.built_entries().values():
+            _reset_default_sources(child)
+
+
+def _file_signature(path) -> Optional[Tuple[int, int, int]]:
+    """ :return: (mtime_ns, size, inode) of a local file, None when it can't be cheaply checked """
+    if not isinstance(path, str):
+        return None
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+
+def _text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _write_parse_cache(cache_path: Path, data: dict):
+    # JSON is data only, a cache entry can't run code when it's loaded
+    if not _is_json_data(data):
+        return  # eg: YAML dates or integer keys wouldn't round trip, the catalog is parsed every time
+    json_cache.write_entry(cache_path, data)
+
+
+def _is_json_data(data) -> bool:
+    """ :return: whether data loads back equal from JSON """
+    if isinstance(data, dict):
+        return all(isinstance(k, str) and _is_json_data(v) for k, v in data.items())
+    if isinstance(data, list):
+        return all(_is_json_data(v) for v in data)
+    return data is None or isinstance(data, (str, int, float, bool))
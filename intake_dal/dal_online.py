@@ -1,19 +1,48 @@
+import asyncio
 import base64
+import functools
 import io
+import threading
 import time
 import urllib.parse
+import weakref
 from collections import Iterable
-from datetime import datetime
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Future,
+    ThreadPoolExecutor,
+    wait,
+)
 from http import HTTPStatus
-from typing import Callable, Dict, List, Tuple
+from typing import (
+    Awaitable,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+)
 from urllib.parse import ParseResult, urldefrag, urlparse  # noqa: F401
 
+import aiohttp
+import fastavro
 import numpy as np
 import pandas as pd
 import pandavro
 import pkg_resources
 import requests
 from intake import DataSource, Schema
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from intake_dal import avro_columnar
+from intake_dal.chunk_sizer import AdaptiveChunkSizer
+from intake_dal.rate_limiter import RateLimiter
+from intake_dal.ttl_cache import TTLCache
 
 
 class DalOnlineSource(DataSource):
@@ -29,6 +58,11 @@ class DalOnlineSource(DataSource):
 
     DATE_TIME_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
 
+    # base64 Avro in JSON bodies
+    WIRE_FORMAT_JSON = "json"
+    # raw Avro object container bodies with the "application/avro" content type
+    WIRE_FORMAT_AVRO = "avro"
+
     def __init__(self, urlpath, key=None, storage_options=None, metadata=None):
         """
             Fetches rows from the Online Feature Store (FS).
@@ -50,7 +84,24 @@ class DalOnlineSource(DataSource):
         self._key_value = key
         super().__init__(metadata=metadata)
 
+    def _rebind(self, key=None):
+        """ Sets the per call parameters of a copy of a cached source, see DalSource._instantiate_source(). """
+        self._key_value = key
+
+    @property
+    def key_name(self) -> str:
+        """ The primary key column name, from the url fragment. """
+        return self._key_name
+
     def write(self, df: pd.DataFrame) -> List[Tuple[float, float]]:
+        return self.write_chunked([df])
+
+    def write_chunked(self, frames: Iterable) -> List[Tuple[float, float]]:
+        """
+        Streams an iterable of DataFrames, eg: another source read_chunked(), to the Online FS.
+        Frames are pulled one at a time and only write_parallelism chunks are in flight,
+        so memory is bounded by a frame plus the chunks being uploaded.
+        """
         self._get_schema()
 
         def post_lambda(avro_str: str) -> int:
@@ -59,37 +110,323 @@ class DalOnlineSource(DataSource):
                 {"data_set_name": self._canonical_name, "key_value": self._key_name, "avro_rows": avro_str},
             )
 
-        def get_metadata(key: str, default):
-            if DalOnlineSource.name in self.metadata:
-                return self.metadata[DalOnlineSource.name].get(key, default)
-            else:
-                return default
+        def post_binary_lambda(avro_bytes: bytes) -> int:
+            return _http_put_avro_binary_data_set(self._url, self._canonical_name, self._key_name, avro_bytes)
+
+        if self._wire_format() == self.WIRE_FORMAT_AVRO:
+            post, serialize = post_binary_lambda, serialize_panda_df_to_bytes
+        else:
+            post, serialize = post_lambda, serialize_panda_df_to_str
+
+        cache = self._get_cache()
+        written_keys = set()
+
+        def frames_with_written_keys():
+            for frame in frames:
+                if cache is not None and self._key_name in frame:
+                    written_keys.update(str(k) for k in frame[self._key_name].unique())
+                yield frame
 
         # get settings with defaults
-        write_chunk_size = get_metadata("write_chunk_size", default=1000)
-        write_delay_between_chunks_milliseconds = get_metadata(
-            "write_delay_between_chunks_milliseconds", default=50
+        write_chunk_size = self._get_online_metadata("write_chunk_size", default=1000)
+        write_parallelism = self._get_online_metadata("write_parallelism", default=1)
+        try:
+            return _post_in_chunks(
+                frames_with_written_keys(),
+                self._avro_schema,
+                post,
+                write_chunk_size,
+                self._get_rate_limiter(),
+                write_parallelism,
+                self._get_chunk_sizer(write_chunk_size),
+                serialize,
+            )
+        finally:
+            # also on failure since some of the chunks may have been written
+            if cache is not None:
+                cache.invalidate((self._canonical_name, k) for k in written_keys)
+
+    def write_dask(self, ddf) -> List[Tuple[float, float]]:
+        """
+        Streams a Dask DataFrame partition by partition, each partition is computed
+        while the chunks of the previous one are being uploaded.
+        """
+        return self.write_chunked(partition.compute() for partition in ddf.to_delayed())
+
+    def cache_info(self) -> Optional[Dict[str, int]]:
+        """ :return: hits, misses, evictions, entries and bytes of the lookup cache if it's enabled. """
+        self._get_schema()
+        cache = self._get_cache()
+        return None if cache is None else cache.info()
+
+    def _get_cache(self) -> Optional[TTLCache]:
+        """
+        The in-process lookup cache is enabled in the dal-online metadata block by
+        cache_ttl_seconds, cache_max_entries and/or cache_max_bytes.
+
+        The cache is shared by all the sources reading the same url.
+        """
+        ttl_seconds = self._get_online_metadata("cache_ttl_seconds", default=None)
+        max_entries = self._get_online_metadata("cache_max_entries", default=None)
+        max_bytes = self._get_online_metadata("cache_max_bytes", default=None)
+        if ttl_seconds is None and max_entries is None and max_bytes is None:
+            return None
+
+        cache_key = (self._url, ttl_seconds, max_entries, max_bytes)
+        with _caches_lock:
+            if cache_key not in _caches:
+                _caches[cache_key] = TTLCache(ttl_seconds, max_entries, max_bytes)
+            return _caches[cache_key]
+
+    def _get_rows(self) -> List[Dict]:
+        """
+        :return: the rows of the requested keys in keys order, only the keys missing from the cache are fetched.
+            With several keys, a key without rows comes back as an empty row.
+        """
+        multi_key, key_values = self._requested_keys()
+        cache = self._get_cache()
+        if cache is None:
+            return self._fetch(key_values, multi_key)
+
+        rows = self._cached_rows(cache, key_values)
+        missing = [k for k in key_values if rows[str(k)] is None]
+        if missing:
+            fetched = self._fetch(missing, multi_key)
+            if not self._cache_rows(cache, rows, missing, fetched):
+                # rows that can't be matched to their key aren't cached
+                return fetched if len(missing) == len(key_values) else self._fetch(key_values, multi_key)
+        return _rows_in_key_order(rows, key_values, multi_key)
+
+    async def _get_rows_async(self) -> List[Dict]:
+        """ asyncio version of _get_rows(). """
+        multi_key, key_values = self._requested_keys()
+        cache = self._get_cache()
+        if cache is None:
+            return await self._fetch_async(key_values, multi_key)
+
+        rows = self._cached_rows(cache, key_values)
+        missing = [k for k in key_values if rows[str(k)] is None]
+        if missing:
+            fetched = await self._fetch_async(missing, multi_key)
+            if not self._cache_rows(cache, rows, missing, fetched):
+                return fetched if len(missing) == len(key_values) else await self._fetch_async(key_values, multi_key)
+        return _rows_in_key_order(rows, key_values, multi_key)
+
+    def _requested_keys(self) -> Tuple[bool, List]:
+        """ :return: whether several keys are requested, and the keys """
+        multi_key = isinstance(self._key_value, Iterable) and not isinstance(self._key_value, str)
+        return multi_key, list(map(str, self._key_value)) if multi_key else [self._key_value]
+
+    def _cached_rows(self, cache: TTLCache, key_values: List) -> Dict[str, Optional[List[Dict]]]:
+        """ :return: the rows of each key, a key may have no rows or several rows, None when not cached """
+        return {str(k): cache.get((self._canonical_name, str(k))) for k in key_values}
+
+    def _cache_rows(self, cache: TTLCache, rows: Dict, missing: List, fetched: List[Dict]) -> bool:
+        """ Caches and adds to rows the fetched rows of the missing keys, :return: False if they can't be matched """
+        fetched_by_key = _rows_by_key(fetched, self._key_name, [str(k) for k in missing])
+        if fetched_by_key is None:
+            return False
+        for k, key_rows in fetched_by_key.items():
+            cache.put((self._canonical_name, k), key_rows)
+        rows.update(fetched_by_key)
+        return True
+
+    def _fetch(self, key_values: List, multi_key: bool) -> List[Dict]:
+        if multi_key:
+            return self._with_missing_keys(key_values, self._http_get_batched(key_values))
+        else:
+            return self._http_get(key_values[0])
+
+    async def _fetch_async(self, key_values: List, multi_key: bool) -> List[Dict]:
+        if not multi_key:
+            return await self._http_get_async(key_values[0])
+
+        # same batches as _http_get_batched(), read_parallelism requests at a time
+        read_batch_size = self._get_online_metadata("read_batch_size", default=100)
+        semaphore = asyncio.Semaphore(self._get_online_metadata("read_parallelism", default=4))
+
+        async def fetch(batch: List[str]) -> List[Dict]:
+            async with semaphore:
+                return await self._http_get_async(",".join(batch))
+
+        batches = [key_values[i:i + read_batch_size] for i in range(0, len(key_values), read_batch_size)]
+        batches_rows = await asyncio.gather(*[fetch(batch) for batch in batches])
+        return self._with_missing_keys(key_values, [row for rows in batches_rows for row in rows])
+
+    def _with_missing_keys(self, key_values: List, rows: List[Dict]) -> List[Dict]:
+        """
+        Avro containers only hold the rows of the found keys, the rows are put in key order with an
+        empty row for each missing key like the JSON wire format does.
+        """
+        if self._wire_format() != self.WIRE_FORMAT_AVRO:
+            return rows
+        rows_by_key = _rows_by_key(rows, self._key_name, [str(k) for k in key_values])
+        if rows_by_key is None:
+            return rows  # rows that can't be matched to their key are returned as the server sent them
+        return _rows_in_key_order(rows_by_key, key_values, multi_key=True)
+
+    def _wire_format(self) -> str:
+        wire_format = self._get_online_metadata("wire_format", default=self.WIRE_FORMAT_JSON)
+        if wire_format not in (self.WIRE_FORMAT_JSON, self.WIRE_FORMAT_AVRO):
+            raise ValueError(f"wire_format {wire_format} not supported in {self._urlpath}")
+        return wire_format
+
+    def _http_get(self, key_value: str) -> List[Dict]:
+        if self._wire_format() == self.WIRE_FORMAT_AVRO:
+            return _http_get_avro_binary_data_set(self._url, self._canonical_name, key_value)
+        else:
+            return _http_get_avro_data_set(self._url, self._canonical_name, key_value)
+
+    async def _http_get_async(self, key_value: str) -> List[Dict]:
+        if self._wire_format() == self.WIRE_FORMAT_AVRO:
+            return await _aiohttp_get_avro_binary_data_set(self._url, self._canonical_name, key_value)
+        else:
+            return await _aiohttp_get_avro_data_set(self._url, self._canonical_name, key_value)
+
+    def _http_get_batched(self, key_values: List[str]) -> List[Dict]:
+        """
+        Splits the keys in batches of read_batch_size keys per request, fetched
+        read_parallelism requests at a time, and returns the rows in the order of key_values.
+        Missing keys come back as empty rows.
+        """
+        read_batch_size = self._get_online_metadata("read_batch_size", default=100)
+        read_parallelism = self._get_online_metadata("read_parallelism", default=4)
+        batches = [key_values[i:i + read_batch_size] for i in range(0, len(key_values), read_batch_size)]
+
+        def fetch(batch: List[str]) -> List[Dict]:
+            return self._http_get(",".join(batch))
+
+        if len(batches) <= 1 or read_parallelism <= 1:
+            batches_rows = map(fetch, batches)
+        else:
+            with ThreadPoolExecutor(max_workers=min(read_parallelism, len(batches))) as executor:
+                batches_rows = list(executor.map(fetch, batches))
+        return [row for rows in batches_rows for row in rows]
+
+    async def read_async(self) -> pd.DataFrame:
+        """
+        asyncio version of read(): the lookups are made with aiohttp on a connection pool
+        of http_pool_size connections by url and event loop, so one process can fan out
+        many concurrent lookups without a thread per lookup.
+        """
+        self._get_schema()
+        await _configure_aiohttp_session(self._url, self._get_http_settings())
+        rows = await self._get_rows_async()
+        return _apply_dtypes(pd.DataFrame(rows), self._dtypes, self.DATE_TIME_FORMAT)
+
+    async def write_async(self, df: pd.DataFrame) -> List[Tuple[float, float]]:
+        """
+        asyncio version of write(): chunks are serialized on the event loop default executor
+        and uploaded with aiohttp, write_parallelism chunks at a time.
+        """
+        self._get_schema()
+        await _configure_aiohttp_session(self._url, self._get_http_settings())
+        if self._wire_format() == self.WIRE_FORMAT_AVRO:
+            serialize = serialize_panda_df_to_bytes
+
+            async def put(avro_bytes: bytes) -> int:
+                return await _aiohttp_put_avro_binary_data_set(
+                    self._url, self._canonical_name, self._key_name, avro_bytes
+                )
+
+        else:
+            serialize = serialize_panda_df_to_str
+
+            async def put(avro_str: str) -> int:
+                return await _aiohttp_put_avro_data_set(
+                    self._url,
+                    {"data_set_name": self._canonical_name, "key_value": self._key_name, "avro_rows": avro_str},
+                )
+
+        write_chunk_size = self._get_online_metadata("write_chunk_size", default=1000)
+        chunk_sizer = self._get_chunk_sizer(write_chunk_size)
+        chunks = chunk_sizer.iter_chunks(df) if chunk_sizer else _iter_chunks(df, write_chunk_size)
+        post = functools.partial(
+            _serialize_and_put_async,
+            avro_schema=self._avro_schema,
+            put=put,
+            rate_limiter=self._get_rate_limiter(),
+            chunk_sizer=chunk_sizer,
+            serialize=serialize,
         )
-        return _post_in_chunks(
-            df, self._avro_schema, post_lambda, write_chunk_size, write_delay_between_chunks_milliseconds
+        try:
+            return await _put_chunks_async(chunks, post, self._get_online_metadata("write_parallelism", default=1))
+        finally:
+            # also on failure since some of the chunks may have been written
+            cache = self._get_cache()
+            if cache is not None and self._key_name in df:
+                cache.invalidate((self._canonical_name, str(k)) for k in df[self._key_name].unique())
+
+    def _get_online_metadata(self, key: str, default):
+        if DalOnlineSource.name in self.metadata:
+            return self.metadata[DalOnlineSource.name].get(key, default)
+        else:
+            return default
+
+    def _get_http_settings(self) -> "HttpSettings":
+        """
+        The pooled HTTP session used for this source url is configured in the dal-online metadata block
+        by http_pool_size, http_timeout_seconds, http_retries and http_backoff_factor.
+        """
+        get = self._get_online_metadata
+        default = HttpSettings()
+        return HttpSettings(
+            # at least one connection per concurrent writer
+            pool_size=get("http_pool_size", default=max(default.pool_size, get("write_parallelism", 1))),
+            timeout_seconds=get("http_timeout_seconds", default=default.timeout_seconds),
+            retries=get("http_retries", default=default.retries),
+            backoff_factor=get("http_backoff_factor", default=default.backoff_factor),
         )
 
-    def _get_partition(self, _) -> pd.DataFrame:
+    def _get_chunk_sizer(self, write_chunk_size: int) -> Optional[AdaptiveChunkSizer]:
+        """
+        write_adaptive_chunk_size: True in the dal-online metadata block turns on adaptive chunk sizing,
+        starting from write_chunk_size rows and bounded by write_min_chunk_size/write_max_chunk_size.
+        The size targets are write_target_chunk_bytes of Avro payload and optionally
+        write_target_chunk_milliseconds of serialize + post latency.
+        """
+        if not self._get_online_metadata("write_adaptive_chunk_size", default=False):
+            return None
+        return AdaptiveChunkSizer(
+            initial_size=write_chunk_size,
+            min_size=self._get_online_metadata("write_min_chunk_size", default=1),
+            max_size=self._get_online_metadata("write_max_chunk_size", default=100000),
+            target_bytes=self._get_online_metadata("write_target_chunk_bytes", default=1024 * 1024),
+            target_milliseconds=self._get_online_metadata("write_target_chunk_milliseconds", default=None),
+        )
 
-        def http_get_argument():
-            if isinstance(self._key_value, Iterable) and not isinstance(self._key_value, str):
-                return ",".join(map(str, self._key_value))
-            else:
-                return self._key_value
+    def _get_rate_limiter(self) -> Optional[RateLimiter]:
+        """
+        Write pacing is configured in the dal-online metadata block by
+        write_rows_per_second and/or write_requests_per_second.  Without them
+        write_delay_between_chunks_milliseconds is used as a requests per second budget.
 
+        The rate limiter is shared by all sources writing the same data set to the same url.
+        """
+        rows_per_second = self._get_online_metadata("write_rows_per_second", default=None)
+        requests_per_second = self._get_online_metadata("write_requests_per_second", default=None)
+        requests_burst = None
+        if rows_per_second is None and requests_per_second is None:
+            delay_milliseconds = self._get_online_metadata(
+                "write_delay_between_chunks_milliseconds", default=50
+            )
+            if not delay_milliseconds:
+                return None
+            requests_per_second = 1000 / delay_milliseconds
+            requests_burst = 1
+
+        limiter_key = (self._url, self._canonical_name, rows_per_second, requests_per_second, requests_burst)
+        with _rate_limiters_lock:
+            if limiter_key not in _rate_limiters:
+                _rate_limiters[limiter_key] = RateLimiter(
+                    rows_per_second, requests_per_second, requests_burst
+                )
+            return _rate_limiters[limiter_key]
+
+    def _get_partition(self, _) -> pd.DataFrame:
         self._get_schema()
 
-        data = _http_get_avro_data_set(self._url, self._canonical_name, http_get_argument())
-        for row in data:
-            for key, field in row.items():
-                if isinstance(field, dict) and "format" in field:
-                    row[key] = datetime.strptime(field["time"], self.DATE_TIME_FORMAT)
-        return pd.DataFrame(data)
+        return _apply_dtypes(pd.DataFrame(self._get_rows()), self._dtypes, self.DATE_TIME_FORMAT)
 
     def _close(self):
         pass
@@ -100,6 +437,7 @@ class DalOnlineSource(DataSource):
             self._avro_schema = self.metadata["avro_schema"]
             self._dtypes = self.metadata["dtypes"]
             self._storage_mode = self.metadata["storage_mode"]
+            _configure_http_session(self._url, self._get_http_settings())
 
         return Schema(
             datashape=None,
@@ -115,59 +453,455 @@ class DalOnlineSource(DataSource):
 
 
 AVRO_DATA_SETS_PATH = "avro-data-sets"
+AVRO_CONTENT_TYPE = "application/avro"
+
+_rate_limiters: Dict[Tuple, RateLimiter] = {}
+_rate_limiters_lock = threading.Lock()
+
+_caches: Dict[Tuple, TTLCache] = {}
+_caches_lock = threading.Lock()
+
+
+def _apply_dtypes(df: pd.DataFrame, dtypes: Optional[Dict[str, str]], date_time_format: str) -> pd.DataFrame:
+    """
+    Columnar decode of the Online FS rows:
+     - timestamp columns, ie: datetime64 in dtypes or {"format": ..., "time": ...} values, are parsed in bulk.
+     - other columns are cast to their dtype unless they have missing values (eg: empty rows of missing keys).
+    """
+    dtypes = dtypes or {}
+    for column in df.columns:
+        dtype = dtypes.get(column)
+        series = df[column]
+        if _is_time_dict(series):
+            df[column] = pd.to_datetime(series.str.get("time"), format=date_time_format)
+        elif dtype and dtype.startswith("datetime64"):
+            series = pd.to_datetime(series)
+            # Avro timestamps decode as UTC, keep them naive like the JSON wire format
+            df[column] = series.dt.tz_convert(None) if series.dt.tz is not None else series
+        elif dtype and series.dtype != dtype and not series.isnull().any() and _fits_dtype(series, dtype):
+            try:
+                df[column] = series.astype(dtype)
+            except (TypeError, ValueError):
+                pass  # leave the column as the server sent it
+    return df
+
+
+def _rows_in_key_order(rows: Dict[str, List[Dict]], key_values: List, multi_key: bool) -> List[Dict]:
+    # cached rows are shared, callers get their own copy
+    return [dict(row) for k in key_values for row in rows[str(k)] or ([{}] if multi_key else [])]
+
+
+def _rows_by_key(rows: List[Dict], key_name: str, keys: List[str]) -> Optional[Dict[str, List[Dict]]]:
+    """
+    :return: the rows of each key, empty rows of missing keys are dropped,
+        None when a row has no key or the key of another request
+    """
+    rows_by_key: Dict[str, List[Dict]] = {k: [] for k in keys}
+    for row in rows:
+        if all(value is None for value in row.values()):
+            continue
+        key = row.get(key_name)
+        if key is None or str(key) not in rows_by_key:
+            return None
+        rows_by_key[str(key)].append(row)
+    return rows_by_key
+
+
+def _fits_dtype(series: pd.Series, dtype: Union[str, np.dtype]) -> bool:
+    """
+    :return: False when casting series to a numeric or boolean dtype would change its values,
+        eg: 3000000000 wrapping around in int32 or "no" becoming True
+    """
+    try:
+        dtype = np.dtype(dtype)
+    except TypeError:
+        return True
+    if dtype.kind not in "biuf":
+        return True
+    if series.dtype.kind not in "biuf":
+        if series.dtype.kind != "O" or pd.api.types.infer_dtype(series, skipna=True) not in ("integer", "boolean"):
+            return False
+    if dtype.kind in "iu" and len(series) > 0:
+        info = np.iinfo(dtype)
+        return info.min <= series.min() and series.max() <= info.max
+    return True
+
+
+def _is_time_dict(series: pd.Series) -> bool:
+    if series.dtype != object:
+        return False
+    first_valid_index = series.first_valid_index()
+    if first_valid_index is None:
+        return False
+    first = series[first_valid_index]
+    return isinstance(first, dict) and "time" in first
 
 
 def _post_in_chunks(
-    df: pd.DataFrame,
+    df: Union[pd.DataFrame, Iterable],
     avro_schema: Dict,
     post_lambda: Callable[[str], int],
     write_chunk_size: int,
-    write_delay_between_chunks_milliseconds: int,
+    rate_limiter: Optional[RateLimiter] = None,
+    write_parallelism: int = 1,
+    chunk_sizer: Optional[AdaptiveChunkSizer] = None,
+    serialize: Callable[[pd.DataFrame, Dict], Union[str, bytes]] = None,
 ) -> List[Tuple[float, float]]:
     """
-    :param df: DataFrame to post
+    :param df: DataFrame, or iterable of DataFrames pulled one at a time, to post
     :param post_lambda: Lambda to pust the avro to and it returns the status code.
+    :param rate_limiter: paces the posts, shared across all the workers.
+    :param write_parallelism: max number of chunks being serialized/posted concurrently.
+    :param chunk_sizer: when set it adapts the chunk sizes and write_chunk_size is ignored.
+    :param serialize: serializes a chunk to the post_lambda payload, defaults to serialize_panda_df_to_str.
     :return: list of durations of how long it took to (serialize to Avro, run post_lambda)
     """
-    times = []
-    number_of_chunks = np.math.ceil(len(df) / write_chunk_size)
-    for i, chunk in enumerate(np.array_split(df, number_of_chunks)):
-        if i != 0:
-            time.sleep(write_delay_between_chunks_milliseconds / 1000)  # sleep takes seconds
+    # chunks are lazy iloc views so only the chunks in flight are serialized at a time
+    frames = [df] if isinstance(df, pd.DataFrame) else df
+    chunks = (
+        chunk
+        for frame in frames
+        for chunk in (chunk_sizer.iter_chunks(frame) if chunk_sizer else _iter_chunks(frame, write_chunk_size))
+    )
+
+    post = functools.partial(
+        _serialize_and_post,
+        avro_schema=avro_schema,
+        post_lambda=post_lambda,
+        rate_limiter=rate_limiter,
+        chunk_sizer=chunk_sizer,
+        serialize=serialize or serialize_panda_df_to_str,
+    )
+    if write_parallelism <= 1:
+        return [post(chunk) for chunk in chunks]
+    else:
+        return _post_chunks_concurrently(chunks, post, write_parallelism)
+
+
+def _iter_chunks(df: pd.DataFrame, chunk_size: int) -> Iterator[pd.DataFrame]:
+    for offset in range(0, len(df), chunk_size):
+        yield df.iloc[offset:offset + chunk_size]
+
+
+def _post_chunks_concurrently(
+    chunks: Iterable, post: Callable[[pd.DataFrame], Tuple[float, float]], write_parallelism: int
+) -> List[Tuple[float, float]]:
+    """
+    Serializes and posts chunks on a pool of write_parallelism workers so Avro serialization
+    of one chunk overlaps with the HTTP PUT of another.  At most write_parallelism chunks are
+    in flight at a time.
+    """
+    futures: List[Future] = []
+    in_flight: Set[Future] = set()
+    with ThreadPoolExecutor(max_workers=write_parallelism) as executor:
+        try:
+            for chunk in chunks:
+                if len(in_flight) >= write_parallelism:
+                    done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    _raise_first_exception(done)
+                future = executor.submit(post, chunk)
+                futures.append(future)
+                in_flight.add(future)
+        except BaseException:
+            for f in futures:
+                f.cancel()
+            raise
+    # results are returned in chunk order
+    return [f.result() for f in futures]
+
+
+def _serialize_and_post(
+    chunk: pd.DataFrame,
+    avro_schema: Dict,
+    post_lambda: Callable[[str], int],
+    rate_limiter: Optional[RateLimiter] = None,
+    chunk_sizer: Optional[AdaptiveChunkSizer] = None,
+    serialize: Callable[[pd.DataFrame, Dict], Union[str, bytes]] = None,
+) -> Tuple[float, float]:
+    avro_begin_time = time.time()
+    avro_str = (serialize or serialize_panda_df_to_str)(chunk, avro_schema)
+    avro_time = time.time() - avro_begin_time
+
+    if rate_limiter:
+        rate_limiter.acquire(len(chunk))
 
-        avro_begin_time = time.time()
-        avro_str = serialize_panda_df_to_str(chunk, avro_schema)
-        avro_time = time.time() - avro_begin_time
+    post_begin_time = time.time()
+    post_lambda(avro_str)
+    post_time = time.time() - post_begin_time
 
-        post_begin_time = time.time()
-        post_lambda(avro_str)
-        times.append((avro_time, time.time() - post_begin_time))
-    return times
+    if chunk_sizer:
+        chunk_sizer.observe(len(chunk), len(avro_str), avro_time, post_time)
+    return avro_time, post_time
+
+
+async def _put_chunks_async(
+    chunks: Iterable, post: Callable[[pd.DataFrame], Awaitable[Tuple[float, float]]], write_parallelism: int
+) -> List[Tuple[float, float]]:
+    """ asyncio version of _post_chunks_concurrently(), at most write_parallelism chunks are in flight. """
+    tasks: List[asyncio.Future] = []
+    in_flight: Set[asyncio.Future] = set()
+    try:
+        for chunk in chunks:
+            if len(in_flight) >= max(write_parallelism, 1):
+                done, in_flight = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+                _raise_first_exception(done)
+            task = asyncio.ensure_future(post(chunk))
+            tasks.append(task)
+            in_flight.add(task)
+        # results are returned in chunk order
+        return list(await asyncio.gather(*tasks))
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
+
+
+async def _serialize_and_put_async(
+    chunk: pd.DataFrame,
+    avro_schema: Dict,
+    put: Callable[[Union[str, bytes]], Awaitable[int]],
+    rate_limiter: Optional[RateLimiter] = None,
+    chunk_sizer: Optional[AdaptiveChunkSizer] = None,
+    serialize: Callable[[pd.DataFrame, Dict], Union[str, bytes]] = None,
+) -> Tuple[float, float]:
+    """ asyncio version of _serialize_and_post(), serialization runs off the event loop. """
+    avro_begin_time = time.time()
+    avro_str = await _running_loop().run_in_executor(None, serialize or serialize_panda_df_to_str, chunk, avro_schema)
+    avro_time = time.time() - avro_begin_time
+
+    if rate_limiter:
+        await asyncio.sleep(rate_limiter.reserve(len(chunk)))
+
+    post_begin_time = time.time()
+    await put(avro_str)
+    post_time = time.time() - post_begin_time
+
+    if chunk_sizer:
+        chunk_sizer.observe(len(chunk), len(avro_str), avro_time, post_time)
+    return avro_time, post_time
+
+
+def _raise_first_exception(futures: Iterable):
+    for f in futures:
+        if f.done() and f.exception() is not None:
+            raise f.exception()
+
+
+class HttpSettings(NamedTuple):
+    pool_size: int = 10
+    timeout_seconds: float = 60
+    retries: int = 3
+    backoff_factor: float = 0.1
+
+
+# Connection pooled (keep-alive) sessions by Online FS url, shared by all the sources of that url.
+_http_sessions: Dict[str, Tuple[HttpSettings, requests.Session]] = {}
+_http_sessions_lock = threading.Lock()
+
+RETRY_STATUS_CODES = (
+    HTTPStatus.INTERNAL_SERVER_ERROR.value,
+    HTTPStatus.BAD_GATEWAY.value,
+    HTTPStatus.SERVICE_UNAVAILABLE.value,
+    HTTPStatus.GATEWAY_TIMEOUT.value,
+)
+
+
+def _new_http_session(settings: HttpSettings) -> requests.Session:
+    retry_kwargs = dict(
+        total=settings.retries,
+        backoff_factor=settings.backoff_factor,
+        status_forcelist=RETRY_STATUS_CODES,
+        raise_on_status=False,
+    )
+    try:
+        # PUTs of avro rows are idempotent upserts so they are safe to retry
+        retry = Retry(allowed_methods=frozenset(["GET", "PUT"]), **retry_kwargs)
+    except TypeError:  # urllib3 < 1.26
+        retry = Retry(method_whitelist=frozenset(["GET", "PUT"]), **retry_kwargs)
+
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=settings.pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def _configure_http_session(url: str, settings: HttpSettings) -> Tuple[HttpSettings, requests.Session]:
+    with _http_sessions_lock:
+        current = _http_sessions.get(url)
+        if current is None or current[0] != settings:
+            current = (settings, _new_http_session(settings))
+            _http_sessions[url] = current
+        return current
+
+
+def _http_session(url: str) -> Tuple[HttpSettings, requests.Session]:
+    return _http_sessions.get(url) or _configure_http_session(url, HttpSettings())
 
 
 def _http_get_avro_data_set(url: str, canonical_name: str, key_value: str) -> List[Dict]:
-    response = requests.get(urllib.parse.urljoin(url, f"{AVRO_DATA_SETS_PATH}/{canonical_name}/{key_value}"))
+    settings, session = _http_session(url)
+    response = session.get(
+        urllib.parse.urljoin(url, f"{AVRO_DATA_SETS_PATH}/{canonical_name}/{key_value}"),
+        timeout=settings.timeout_seconds,
+    )
     if response.status_code != HTTPStatus.OK.value:
         raise Exception(f"url={response.url} code={response.status_code}: {response.text}")
     return response.json()["data"]
 
 
 def _http_put_avro_data_set(url: str, json: Dict) -> int:
-    response = requests.put(urllib.parse.urljoin(url, f"{AVRO_DATA_SETS_PATH}/"), json=json)
+    settings, session = _http_session(url)
+    response = session.put(
+        urllib.parse.urljoin(url, f"{AVRO_DATA_SETS_PATH}/"), json=json, timeout=settings.timeout_seconds
+    )
     if response.status_code != HTTPStatus.OK.value:
         raise Exception(f"url={response.url} code={response.status_code}: {response.text}")
     return response.status_code
 
 
-def serialize_panda_df_to_str(df: pd.DataFrame, schema: Dict) -> str:
+def _http_get_avro_binary_data_set(url: str, canonical_name: str, key_value: str) -> List[Dict]:
+    settings, session = _http_session(url)
+    with session.get(
+        urllib.parse.urljoin(url, f"{AVRO_DATA_SETS_PATH}/{canonical_name}/{key_value}"),
+        headers={"Accept": AVRO_CONTENT_TYPE},
+        timeout=settings.timeout_seconds,
+        stream=True,
+    ) as response:
+        if response.status_code != HTTPStatus.OK.value:
+            raise Exception(f"url={response.url} code={response.status_code}: {response.text}")
+        # decode the Avro container straight from the socket
+        response.raw.decode_content = True
+        return list(fastavro.reader(response.raw))
+
+
+def _http_put_avro_binary_data_set(url: str, canonical_name: str, key_name: str, avro_bytes: bytes) -> int:
+    settings, session = _http_session(url)
+    response = session.put(
+        urllib.parse.urljoin(url, f"{AVRO_DATA_SETS_PATH}/{canonical_name}"),
+        params={"key_value": key_name},
+        data=avro_bytes,
+        headers={"Content-Type": AVRO_CONTENT_TYPE},
+        timeout=settings.timeout_seconds,
+    )
+    if response.status_code != HTTPStatus.OK.value:
+        raise Exception(f"url={response.url} code={response.status_code}: {response.text}")
+    return response.status_code
+
+
+# aiohttp sessions of the asyncio API by event loop and Online FS url, a session can't be shared across loops
+_aiohttp_sessions: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict]" = weakref.WeakKeyDictionary()
+
+# asyncio.get_running_loop() is python 3.7+, in a coroutine get_event_loop() returns the running loop
+_running_loop = getattr(asyncio, "get_running_loop", asyncio.get_event_loop)
+
+
+async def _configure_aiohttp_session(url: str, settings: HttpSettings) -> Tuple[HttpSettings, aiohttp.ClientSession]:
+    sessions = _aiohttp_sessions.setdefault(_running_loop(), {})
+    current = sessions.get(url)
+    if current is None or current[0] != settings or current[1].closed:
+        if current is not None:
+            await current[1].close()
+        session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=settings.pool_size),
+            timeout=aiohttp.ClientTimeout(total=settings.timeout_seconds),
+        )
+        current = sessions[url] = (settings, session)
+    return current
+
+
+async def _aiohttp_session(url: str) -> Tuple[HttpSettings, aiohttp.ClientSession]:
+    return _aiohttp_sessions.get(_running_loop(), {}).get(url) or await _configure_aiohttp_session(url, HttpSettings())
+
+
+async def close_aiohttp_sessions():
+    """ Closes the aiohttp sessions of the running loop, eg: before closing the loop. """
+    sessions = _aiohttp_sessions.pop(_running_loop(), {})
+    for _, session in sessions.values():
+        await session.close()
+
+
+async def _aiohttp_request(
+    method: str, url: str, path: str, read: Callable[[aiohttp.ClientResponse], Awaitable], **kwargs
+):
+    """
+    :return: read(response) of a 200 response on the session of url, server errors and connection
+        errors are retried like the requests sessions do, see _new_http_session()
+    """
+    settings, session = await _aiohttp_session(url)
+    for attempt in range(settings.retries + 1):
+        if attempt > 0:
+            await asyncio.sleep(settings.backoff_factor * 2 ** (attempt - 1))
+        try:
+            async with session.request(method, urllib.parse.urljoin(url, path), **kwargs) as response:
+                if response.status in RETRY_STATUS_CODES and attempt < settings.retries:
+                    continue
+                if response.status != HTTPStatus.OK.value:
+                    raise Exception(f"url={response.url} code={response.status}: {await response.text()}")
+                return await read(response)
+        except aiohttp.ClientConnectionError:
+            if attempt == settings.retries:
+                raise
+
+
+async def _read_status(response: aiohttp.ClientResponse) -> int:
+    return response.status
+
+
+async def _aiohttp_get_avro_data_set(url: str, canonical_name: str, key_value: str) -> List[Dict]:
+    async def read(response: aiohttp.ClientResponse) -> List[Dict]:
+        return (await response.json())["data"]
+
+    return await _aiohttp_request("GET", url, f"{AVRO_DATA_SETS_PATH}/{canonical_name}/{key_value}", read)
+
+
+async def _aiohttp_put_avro_data_set(url: str, json: Dict) -> int:
+    return await _aiohttp_request("PUT", url, f"{AVRO_DATA_SETS_PATH}/", _read_status, json=json)
+
+
+async def _aiohttp_get_avro_binary_data_set(url: str, canonical_name: str, key_value: str) -> List[Dict]:
+    async def read(response: aiohttp.ClientResponse) -> List[Dict]:
+        return list(fastavro.reader(io.BytesIO(await response.read())))
+
+    return await _aiohttp_request(
+        "GET",
+        url,
+        f"{AVRO_DATA_SETS_PATH}/{canonical_name}/{key_value}",
+        read,
+        headers={"Accept": AVRO_CONTENT_TYPE},
+    )
+
+
+async def _aiohttp_put_avro_binary_data_set(url: str, canonical_name: str, key_name: str, avro_bytes: bytes) -> int:
+    return await _aiohttp_request(
+        "PUT",
+        url,
+        f"{AVRO_DATA_SETS_PATH}/{canonical_name}",
+        _read_status,
+        params={"key_value": key_name},
+        data=avro_bytes,
+        headers={"Content-Type": AVRO_CONTENT_TYPE},
+    )
+
+
+def serialize_panda_df_to_bytes(df: pd.DataFrame, schema: Dict) -> bytes:
+    try:
+        # same bytes as the pandavro path below without converting the DataFrame row by row
+        return avro_columnar.serialize(df, schema)
+    except avro_columnar.UnsupportedAvroSchema:
+        pass
+
     with io.BytesIO() as bytes_io:
         # else we get: ValueError: NaTType does not support timestamp
         # it's really a pandavro issue, see https://github.com/fastavro/fastavro/issues/313
         # TODO(talebz): Create a Pandavro issue for this!
         df = df.replace({np.nan: None})
         pandavro.to_avro(bytes_io, df, schema=schema)
-        bytes_io.seek(0)
-        return base64.b64encode(bytes_io.read()).decode("utf-8")
+        return bytes_io.getvalue()
+
+
+def serialize_panda_df_to_str(df: pd.DataFrame, schema: Dict) -> str:
+    return base64.b64encode(serialize_panda_df_to_bytes(df, schema)).decode("utf-8")
 
 
 def deserialize_avro_str_to_pandas(avro_str: str, schema: dict = None) -> pd.DataFrame:
@@ -1,13 +1,54 @@
+import copy
+import functools
 import json
-from typing import Dict, Iterable, List, Optional, Tuple, Union
+import logging
+import multiprocessing
+import operator
+import sys
+import threading
+import time
+from concurrent.futures import (
+    Executor,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+)
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+    Union,
+)
 from urllib.parse import ParseResult, urlparse
 
 import numpy as np
 import pandas as pd
 import pkg_resources
+from fsspec.core import get_fs_token_paths
 from intake import DataSource, Schema
 from intake.catalog.local import LocalCatalogEntry
 
+from intake_dal import kafka_schema_registry
+from intake_dal.dal_online import _fits_dtype, _running_loop
+from intake_dal.ttl_cache import TTLCache
+
+
+# per call parameters of the storage mode drivers, rebound on copies of the cached sources by their _rebind()
+REBOUND_PARAMETERS = ("key",)
+# the drivers reading their partitions with dask
+DASK_DRIVERS = ("csv", "parquet")
+# the drivers without a write(), DalSource writes their files
+FILE_WRITE_DRIVERS = ("csv", "parquet")
+# the drivers reading the rows of a key, by the key column of the url fragment
+KEY_VALUE_DRIVERS = {"dal-online": None, "in-memory-kvs": "key"}
+SOURCE_CACHE_MAX_ENTRIES = 1024
+
+logger = logging.getLogger(__name__)
+
 
 class DalSource(DataSource):
     """
@@ -28,38 +69,83 @@ class DalSource(DataSource):
           local: 'csv://{{ CATALOG_DIR }}/data/user_events.csv'
           serving: 'in-memory-kv://foo'
           batch: 'parquet://{{ CATALOG_DIR }}/data/user_events.parquet'
+        # optional, read() tries the storage modes in order when storage_mode isn't given
+        storage_chain: [serving, batch]
     """
 
     container = "dataframe"
     name = "dal"
     version = pkg_resources.get_distribution("intake-dal").version
 
-    def __init__(self, storage, default, storage_mode=None, metadata=None, **kwargs):
+    def __init__(
+        self,
+        storage,
+        default,
+        storage_mode=None,
+        metadata=None,
+        enforce_dtypes=False,
+        category_threshold=None,
+        columns=None,
+        filters=None,
+        storage_chain=None,
+        backfill=False,
+        **kwargs,
+    ):
         """
         Parameters
         ----------
-        path: str
-            Location of the file to parse (can be remote)
-        reload : bool
-            Whether to watch the source file for changes; make False if you want
-            an editable Catalog
+        storage: dict
+            URL of the dataset by storage mode
+        default: str
+            The storage mode used when storage_mode is not given
+        enforce_dtypes: bool
+            Casts the columns read to the dtypes of the Avro schema, eg: int32 or float32
+            instead of int64 and float64.  Non nullable float dtypes are given to the csv driver
+            directly.  Integer and boolean columns are cast after the read unless they contain nulls
+            or values the dtype would change.
+        category_threshold: float
+            With enforce_dtypes, string columns with at most category_threshold * rows distinct
+            values are read as category.  Not applied by to_dask().
+        columns: list of str
+            Columns to read, pushed down to parquet and csv (usecols) and validated against the Avro schema.
+        filters: list of (column, op, value) tuples or a list of lists of them for OR-ed conjunctions
+            Rows to read, op is one of ==, !=, <, <=, >, >=, in, not in.  Pushed down to parquet
+            to skip row groups, and applied to the rows read for all the storage modes.
+        storage_chain: list of str
+            Storage modes read() tries in order, from the fastest, when storage_mode isn't given.
+            A storage mode returning no rows, or only empty rows, or failing falls back to the next one.
+            The storage modes whose driver doesn't take a key read the rows of the key column of the
+            first key value storage mode of the chain.  With several keys, each storage mode reads the
+            keys the previous ones missed.  The other methods use the storage_mode or default storage mode.
+        backfill: bool
+            With storage_chain, writes the rows read to the storage modes that returned no rows.
+            Backfill failures don't fail the read.
         """
         super(DalSource, self).__init__(metadata)
         self.storage = storage
         self.default = default
         self.storage_mode = storage_mode
+        self.enforce_dtypes = enforce_dtypes
+        self.category_threshold = category_threshold
+        self.columns = list(columns) if columns is not None else None
+        self.filters = _normalize_filters(filters)
+        self.storage_chain = list(storage_chain) if storage_chain else None
+        self.backfill = backfill
+        _validate_storage_chain(self.storage, self.storage_chain, self.backfill, self.columns, self.filters)
         self.kwargs = kwargs
         self.metadata = metadata
         self.source = None
-        self._canonical_name = None  # _get_schema() sets this
-        self._avro_schema = None  # _get_schema() sets this
-        self._dtypes = None  # _get_schema() sets this
+        self._canonical_name = None  # _resolve_data_schema() sets this
+        self._avro_schema = None  # _resolve_data_schema() sets this
+        self._schema_dtypes = None  # _resolve_data_schema() sets this
+        self._dtypes = None  # _resolve_data_schema() sets this
 
     def _get_source(self):
         if self.catalog_object is None:
             raise ValueError("DalSource cannot be used outside a catalog")
         if self.source is None:
-            self._get_schema()
+            self._resolve_data_schema()
+            _validate_read_options(self._avro_schema, self.columns, self.filters)
             self.source = self._instantiate_source()
             self.metadata = self.source.metadata.copy()
             self.container = self.source.container
@@ -67,22 +153,35 @@ class DalSource(DataSource):
             self.description = self.source.description
             self.datashape = self.source.datashape
 
-    def _get_schema(self) -> Schema:
+    def _resolve_data_schema(self):
         if self._canonical_name is None:
 
             self._canonical_name = _get_dal_canonical_name(self)
             # TODO(talebz): Getting avro schema should be promoted to Intake
-            avro_schema = _get_avro(self, self._canonical_name)
-            if avro_schema:
-                self._avro_schema = avro_schema
-                self._schema_dtypes = _avro_to_dtype(self._avro_schema)
-                self._dtypes = {k: str(v) for (k, v) in self._schema_dtypes.items()}
+            data_schema = _get_data_schema(self, self._canonical_name)
+            if data_schema:
+                self._avro_schema = data_schema.avro_schema
+                self._schema_dtypes = dict(data_schema.schema_dtypes)
+                self._dtypes = dict(data_schema.dtypes)
+
+    def _get_schema(self) -> Schema:
+        """ The partitions and shape are the ones of the storage mode source, eg: the files of a parquet dataset. """
+        self._get_source()
+        self.source._load_metadata()
+        rows, columns = self.source.shape or (None, None)
+        dtypes = self._dtypes
+        if self.columns is not None:
+            columns = len(self.columns)
+            if dtypes:
+                dtypes = {column: dtypes[column] for column in self.columns if column in dtypes}
+        elif dtypes:
+            columns = len(dtypes)
 
         return Schema(
             datashape=None,
-            dtype=self._dtypes,
-            shape=(None, len(self._dtypes) if self._dtypes else None),
-            npartitions=1,  # This data is not partitioned, so there is only one partition
+            dtype=dtypes,
+            shape=(None if self.filters else rows, columns),
+            npartitions=self.source.npartitions,
             extra_metadata={
                 "canonical_name": self._canonical_name,
                 "storage_mode": self.storage_mode,
@@ -121,25 +220,48 @@ class DalSource(DataSource):
         mode_url = mode
         if isinstance(mode, dict):
             mode_url = mode["url"]
-            args = mode.get("args", {})
+            args = dict(mode.get("args", {}))
 
         parse_result, url_path = self.parse_storage_mode_url(mode_url)
-        desc = self.catalog_object[self.name].describe()
-
-        if parse_result.scheme == "parquet":
-            # https://github.com/dask/dask/issues/5272: Dask parquet metadata w/ ~2k files very slow
-            if "gather_statistics" not in args:
-                args["gather_statistics"] = False
-
-            if "engine" not in args:
-                args["engine"] = "pyarrow"
+        args = self._driver_args(parse_result.scheme, args)
+        catalog_entry = self.catalog_object[self.name]
+        rebound = {k: v for k, v in self.kwargs.items() if k in REBOUND_PARAMETERS}
+        kwargs = {k: v for k, v in self.kwargs.items() if k not in REBOUND_PARAMETERS}
+
+        # a reloaded catalog creates new entries for the changed datasets
+        cache_key = (
+            id(catalog_entry),
+            self.storage_mode,
+            mode_url,
+            json.dumps([args, kwargs, self._avro_schema], sort_keys=True, default=repr),
+        )
+        cached = _source_cache.get(cache_key)
+        if cached is not None and cached[0] is catalog_entry:
+            template = cached[1]
+        else:
+            template = self._create_source(catalog_entry, parse_result.scheme, url_path, args, kwargs)
+            # the catalog entry is kept so its id can't be reused by another entry
+            _source_cache.put(cache_key, (catalog_entry, template))
+
+        if rebound and not hasattr(template, "_rebind"):
+            # the driver can't rebind them, they are given to a new source
+            return self._create_source(catalog_entry, parse_result.scheme, url_path, args, self.kwargs)
+
+        # the template is never read, each copy discovers the current data
+        source = copy.copy(template)
+        source.metadata = dict(template.metadata)
+        if hasattr(source, "_rebind"):
+            source._rebind(**rebound)
+        return source
 
+    def _create_source(self, catalog_entry, driver: str, url_path: str, args: Dict, kwargs: Dict) -> DataSource:
+        desc = catalog_entry.describe()
         entry = LocalCatalogEntry(
             name=desc["name"],
             description=desc["description"],
-            driver=parse_result.scheme,
+            driver=driver,
             args={"urlpath": url_path, **args},
-            parameters=self.catalog_object[self.name]._user_parameters,
+            parameters=catalog_entry._user_parameters,
             catalog=self.cat,
         )
 
@@ -150,7 +272,7 @@ class DalSource(DataSource):
             "dtypes": self._dtypes,
         }
 
-        source = entry.get(metadata=self.metadata, **self.kwargs)
+        source = entry.get(metadata=self.metadata, **kwargs)
         # source = entry.get(metadata=self.metadata, **{**self.kwargs, **params})
 
         source.metadata["url_path"] = url_path
@@ -158,26 +280,276 @@ class DalSource(DataSource):
 
         return source
 
+    def _driver_args(self, scheme: str, args: Dict) -> Dict:
+        """ Adds the driver defaults and the read options the driver can push down. """
+        if scheme == "parquet":
+            # https://github.com/dask/dask/issues/5272: Dask parquet metadata w/ ~2k files very slow
+            # unless filters need the statistics to skip row groups
+            if "gather_statistics" not in args and not self.filters:
+                args["gather_statistics"] = False
+
+            if "engine" not in args:
+                args["engine"] = "pyarrow"
+
+            if self.columns is not None:
+                args["columns"] = self._read_columns()
+            if self.filters:
+                args["filters"] = self.filters
+
+        if scheme == "csv" and self.columns is not None:
+            args["csv_kwargs"] = {**args.get("csv_kwargs", {}), "usecols": self._read_columns()}
+
+        if scheme == "csv" and self.enforce_dtypes and self._avro_schema:
+            # parse straight into the narrower float dtypes, dtypes given in the storage args win
+            csv_kwargs = args.get("csv_kwargs", {})
+            dtype = _non_nullable_float_dtypes(self._avro_schema, self._schema_dtypes)
+            args["csv_kwargs"] = {**csv_kwargs, "dtype": {**dtype, **csv_kwargs.get("dtype", {})}}
+        return args
+
     def discover(self):
         self._get_source()
+        self._load_metadata()
         return self.source.discover()
 
     def read(self):
+        if self.storage_chain and self.storage_mode is None:
+            return self._read_chain()
         self._get_source()
-        return self.source.read()
+        if self.filters and self._driver() in DASK_DRIVERS:
+            return self._read_filtered()
+        return self._postprocess(self.source.read())
+
+    def _read_filtered(self) -> pd.DataFrame:
+        """ Filters the rows partition by partition, only the rows kept are ever all in memory. """
+        df = self.to_dask().compute()
+        if self.enforce_dtypes and self._schema_dtypes and self.category_threshold is not None:
+            # partitions would disagree on the categories
+            df = _enforce_dtypes(df, self._schema_dtypes, self.category_threshold)
+        return df
+
+    def _driver(self) -> str:
+        return _storage_mode_url(self.storage[self.storage_mode if self.storage_mode else self.default]).scheme
+
+    def _read_chain(self) -> pd.DataFrame:
+        key = self.kwargs.get("key")
+        key_column = _chain_key_column(self.storage, self.storage_chain)
+        if key_column and isinstance(key, Iterable) and not isinstance(key, str):
+            return self._read_chain_by_key(list(key), key_column)
+
+        missed, error, df = [], None, None
+        for storage_mode in self.storage_chain:
+            tier = self._with_storage_mode(storage_mode, key_column)
+            try:
+                df = tier.read()
+            except Exception as e:
+                logger.warning("%s read from %s failed: %r", self.name, storage_mode, e)
+                error = e
+                continue
+            # key value stores answer missing keys with empty rows
+            if len(df.dropna(how="all")) > 0:
+                if self.backfill:
+                    _backfill(missed, df)
+                return df
+            missed.append(tier)
+
+        if df is None:
+            # every storage mode failed
+            raise error
+        return df
+
+    def _read_chain_by_key(self, keys: List, key_column: str) -> pd.DataFrame:
+        """
+        Reads each storage mode of the chain for the keys the previous ones missed.
+
+        :return: the rows of the keys found in keys order, the keys found nowhere are left out
+        """
+        rows: Dict[str, pd.DataFrame] = {}
+        missed: List[Tuple[DalSource, List]] = []
+        remaining, error, df = keys, None, None
+        for storage_mode in self.storage_chain:
+            tier = self._with_storage_mode(storage_mode, key_column, key=remaining)
+            try:
+                df = tier.read()
+            except Exception as e:
+                logger.warning("%s read from %s failed: %r", self.name, storage_mode, e)
+                error = e
+                continue
+            tier_rows = _rows_of_keys(df, _tier_key_column(self.storage[storage_mode], key_column), remaining)
+            rows.update(tier_rows)
+            missed.append((tier, [k for k in remaining if str(k) not in tier_rows]))
+            remaining = [k for k in remaining if str(k) not in rows]
+            if not remaining:
+                break
+
+        if df is None:
+            # every storage mode failed
+            raise error
+        if self.backfill:
+            _backfill_keys(missed, rows)
+        if not rows:
+            return df
+        return pd.concat([rows[str(k)] for k in keys if str(k) in rows], ignore_index=True, sort=False)
+
+    def _with_storage_mode(self, storage_mode: str, key_column: Optional[str] = None, **kwargs) -> "DalSource":
+        """
+        :return: a copy of this source reading storage_mode only
+        :param key_column: the column of the key for the drivers not taking a key, they filter their rows by it
+        :param kwargs: arguments overriding the ones of this source, eg: key
+        """
+        kwargs = {**self._captured_init_kwargs, **kwargs, "storage_mode": storage_mode, "storage_chain": None}
+        key = kwargs.get("key")
+        takes_key = _storage_mode_url(self.storage[storage_mode]).scheme in KEY_VALUE_DRIVERS
+        if key is not None and key_column and not takes_key:
+            del kwargs["key"]
+            keys = list(key) if isinstance(key, Iterable) and not isinstance(key, str) else [key]
+            key_filter = (key_column, "in", keys)
+            filters = _normalize_filters(kwargs.get("filters")) or [[]]
+            kwargs["filters"] = [conjunction + [key_filter] for conjunction in filters]
+        source = type(self)(*self._captured_init_args, **kwargs)
+        source.catalog_object = self.catalog_object
+        source.name = self.name
+        source.cat = self.cat
+        return source
 
     def read_partition(self, i):
         self._get_source()
-        return self.source.read_partition(i)
+        return self._postprocess(self.source.read_partition(i))
+
+    def read_parallel(self, max_workers: Optional[int] = None, processes: bool = False) -> pd.DataFrame:
+        """
+        Reads all the partitions concurrently and concatenates them in partition order.
+
+        :param max_workers: size of the pool, defaults to the concurrent.futures default
+        :param processes: reads in a process pool instead of a thread pool, for the storage modes
+            whose parsing holds the GIL, eg: csv
+        """
+        self._load_metadata()
+        if self.npartitions <= 1:
+            return self.read()
+
+        read = functools.partial(
+            _read_partition,
+            self.source,
+            columns=self.columns,
+            filters=self.filters,
+            schema_dtypes=self._schema_dtypes if self.enforce_dtypes else None,
+        )
+        with _executor(max_workers, processes) as executor:
+            df = pd.concat(executor.map(read, range(self.npartitions)))
+        if self.enforce_dtypes and self._schema_dtypes and self.category_threshold is not None:
+            # partitions would disagree on the categories
+            df = _enforce_dtypes(df, self._schema_dtypes, self.category_threshold)
+        return df
 
     def read_chunked(self):
         self._get_source()
-        return self.source.read_chunked()
+        if not self._has_read_options():
+            return self.source.read_chunked()
+        return (self._postprocess(df) for df in self.source.read_chunked())
 
     # TODO(talebz): This should also be within Intake but without DataFrame type!
-    def write(self, df: pd.DataFrame):
+    def write(self, df: pd.DataFrame, storage_modes: Optional[List[str]] = None):
+        """
+        Storage modes whose driver can't write, ie: parquet and csv, of a single file are overwritten with df.
+        Partitioned parquet and csv datasets can't be written.
+
+        :param storage_modes: writes df to these storage modes concurrently instead of the storage mode
+            of this source, see WriteResult
+        """
+        if storage_modes is not None:
+            return self._write_fan_out(df, storage_modes)
+        self._check_writable()
+        if hasattr(self.source, "write"):
+            return self.source.write(df)
+        return self._write_file(df)
+
+    def _check_writable(self):
+        """ :raises ValueError: when the storage mode can't be written """
+        self._get_source()
+        if hasattr(self.source, "write"):
+            return
+        storage_mode = self.storage_mode if self.storage_mode else self.default
+        if self._driver() not in FILE_WRITE_DRIVERS:
+            raise ValueError(f"storage mode {storage_mode} driver {self._driver()} can't be written")
+        fs, paths = self._file_paths()
+        if len(paths) != 1 or fs.isdir(paths[0]):
+            raise ValueError(f"storage mode {storage_mode} is a partitioned dataset, only single files can be written")
+
+    def _file_paths(self) -> Tuple[Any, List[str]]:
+        storage_options = self._storage_args().get("storage_options") or {}
+        fs, _, paths = get_fs_token_paths(self.source.metadata["url_path"], storage_options=storage_options)
+        return fs, paths
+
+    def _storage_args(self) -> Dict:
+        mode = self.storage[self.storage_mode if self.storage_mode else self.default]
+        return mode.get("args", {}) if isinstance(mode, dict) else {}
+
+    def _write_file(self, df: pd.DataFrame) -> int:
+        """ Overwrites the parquet or csv file of the storage mode with df. :return: the number of rows written """
+        fs, (path,) = self._file_paths()
+        with fs.open(path, "wb") as f:
+            if self._driver() == "parquet":
+                df.to_parquet(f, engine=self._storage_args().get("engine", "pyarrow"), index=False)
+            else:
+                f.write(df.to_csv(index=False).encode("utf-8"))
+        return len(df)
+
+    def _write_fan_out(self, df: pd.DataFrame, storage_modes: List[str]) -> Dict[str, "WriteResult"]:
+        """
+        :return: the WriteResult of each storage mode
+        :raises ValueError: when a storage mode can't be written, before any of them is written
+        :raises WriteError: when any storage mode failed, after all of them were written
+        """
+        storage_modes = list(dict.fromkeys(storage_modes))
+        _validate_storage_modes(self.storage, storage_modes, "storage_modes")
+        # the data schema is resolved once, the targets get it from the catalog schema registry
+        self._resolve_data_schema()
+        targets = [self._with_storage_mode(storage_mode) for storage_mode in storage_modes]
+        for target in targets:
+            target._check_writable()
+
+        with ThreadPoolExecutor(max_workers=max(len(targets), 1)) as executor:
+            results = {r.storage_mode: r for r in executor.map(functools.partial(_timed_write, df=df), targets)}
+        if any(r.error is not None for r in results.values()):
+            raise WriteError(results)
+        return results
+
+    def write_chunked(self, frames: Iterable[pd.DataFrame]):
+        """
+        Streams an iterable of DataFrames, eg: read_chunked() of another storage mode.
+        Sources without a native write_chunked() write them one at a time.
+        """
         self._get_source()
-        return self.source.write(df)
+        if hasattr(self.source, "write_chunked"):
+            return self.source.write_chunked(frames)
+        return [self.source.write(frame) for frame in frames]
+
+    def write_dask(self, ddf):
+        """ Streams a Dask DataFrame partition by partition. """
+        self._get_source()
+        if hasattr(self.source, "write_dask"):
+            return self.source.write_dask(ddf)
+        return self.write_chunked(partition.compute() for partition in ddf.to_delayed())
+
+    async def read_async(self):
+        """
+        asyncio version of read().  Sources without a native read_async(), eg: csv or parquet,
+        are read on the event loop default executor.
+        """
+        self._get_source()
+        if hasattr(self.source, "read_async"):
+            return self._postprocess(await self.source.read_async())
+        return self._postprocess(await _running_loop().run_in_executor(None, self.source.read))
+
+    async def write_async(self, df: pd.DataFrame):
+        """
+        asyncio version of write().  Sources without a native write_async(), eg: in-memory-kvs,
+        are written on the event loop default executor.
+        """
+        self._get_source()
+        if hasattr(self.source, "write_async"):
+            return await self.source.write_async(df)
+        return await _running_loop().run_in_executor(None, self.source.write, df)
 
     def to_spark(self):
         self._get_source()
@@ -185,7 +557,35 @@ class DalSource(DataSource):
 
     def to_dask(self):
         self._get_source()
-        return self.source.to_dask()
+        ddf = self.source.to_dask()
+        if not self._has_read_options():
+            return ddf
+        postprocess = functools.partial(
+            _apply_read_options,
+            columns=self.columns,
+            filters=self.filters,
+            schema_dtypes=self._schema_dtypes if self.enforce_dtypes else None,
+        )
+        return ddf.map_partitions(postprocess, meta=postprocess(ddf._meta))
+
+    def _has_read_options(self) -> bool:
+        return self.columns is not None or bool(self.filters) or (self.enforce_dtypes and bool(self._schema_dtypes))
+
+    def _read_columns(self) -> List[str]:
+        """ The selected columns followed by the other columns the filters need. """
+        filter_columns = [column for conjunction in self.filters or [] for column, _, _ in conjunction]
+        return list(dict.fromkeys(self.columns + filter_columns))
+
+    def _postprocess(self, df: pd.DataFrame) -> pd.DataFrame:
+        if not self._has_read_options() or not isinstance(df, pd.DataFrame):
+            return df
+        return _apply_read_options(
+            df,
+            self.columns,
+            self.filters,
+            self._schema_dtypes if self.enforce_dtypes else None,
+            self.category_threshold,
+        )
 
     @property
     def avro_schema(self) -> Dict:
@@ -198,6 +598,113 @@ class DalSource(DataSource):
         return self._canonical_name
 
 
+# storage mode sources shared by the DalSource instances of a catalog entry, see DalSource._instantiate_source()
+_source_cache = TTLCache(max_entries=SOURCE_CACHE_MAX_ENTRIES)
+
+
+class WriteResult(NamedTuple):
+    """ The outcome of writing to one storage mode of DalSource.write(df, storage_modes). """
+
+    storage_mode: str
+    seconds: float
+    result: Any  # what the storage mode source write() returned
+    error: Optional[Exception]
+
+
+class WriteError(Exception):
+    """ DalSource.write(df, storage_modes) failed for some storage modes, results has all of them. """
+
+    def __init__(self, results: Dict[str, WriteResult]):
+        self.results = results
+        failed = {r.storage_mode: r.error for r in results.values() if r.error is not None}
+        super().__init__(f"write failed for storage modes {failed}")
+
+
+class DataSchema(NamedTuple):
+    avro_schema: Dict
+    schema_dtypes: Dict[str, np.dtype]
+    dtypes: Dict[str, str]
+
+    @staticmethod
+    def from_avro(avro_schema: Dict) -> "DataSchema":
+        schema_dtypes = _avro_to_dtype(avro_schema)
+        return DataSchema(avro_schema, schema_dtypes, {k: str(v) for (k, v) in schema_dtypes.items()})
+
+
+class SchemaRegistry:
+    """
+    Catalog level memo of the resolved data schema of each canonical name, the Avro JSON
+    and dtype maps of a data_schema entry are computed once for all the sources sharing it.
+    DalCatalog invalidates it whenever the catalog is reloaded with a different content,
+    schemas of a changing source, eg: the latest version in a Kafka schema registry, also expire.
+    """
+
+    def __init__(self):
+        # the data schema and the monotonic time it expires at, if ever
+        self._by_canonical_name: Dict[str, Tuple[Optional[DataSchema], Optional[float]]] = {}
+        self._by_avro_json: Dict[str, DataSchema] = {}
+        self._lock = threading.Lock()
+
+    def get(
+        self,
+        canonical_name: str,
+        resolve: Callable[[], Optional[Union[str, Dict]]],
+        ttl_seconds: Optional[float] = None,
+    ) -> Optional[DataSchema]:
+        """
+        :param resolve: returns the Avro schema JSON or dict of canonical_name, called on the first lookup only
+        :param ttl_seconds: resolve is called again once the schema is older than ttl_seconds, by default never
+        """
+        with self._lock:
+            cached = self._by_canonical_name.get(canonical_name)
+            if cached is not None and (cached[1] is None or time.monotonic() < cached[1]):
+                return cached[0]
+
+        avro_schema = resolve()
+        data_schema = None
+        if isinstance(avro_schema, str):
+            with self._lock:
+                data_schema = self._by_avro_json.get(avro_schema)
+            if data_schema is None:
+                data_schema = DataSchema.from_avro(json.loads(avro_schema))
+        elif avro_schema:
+            data_schema = DataSchema.from_avro(avro_schema)
+
+        expires_at = None if ttl_seconds is None else time.monotonic() + ttl_seconds
+        with self._lock:
+            if isinstance(avro_schema, str):
+                self._by_avro_json[avro_schema] = data_schema
+            self._by_canonical_name[canonical_name] = (data_schema, expires_at)
+        return data_schema
+
+    def invalidate(self):
+        with self._lock:
+            self._by_canonical_name.clear()
+            self._by_avro_json.clear()
+
+
+def _get_schema_registry(source: DataSource) -> Optional[SchemaRegistry]:
+    """ :return: the SchemaRegistry of the root DalCatalog of source if any """
+    cat = source.cat
+    while cat is not None:
+        # vars() avoids the catalog entry lookup of Catalog.__getattr__
+        registry = vars(cat).get("schema_registry")
+        if registry is not None:
+            return registry
+        cat = cat.cat
+    return None
+
+
+def _get_data_schema(source: DataSource, canonical_name: str) -> Optional[DataSchema]:
+    registry = _get_schema_registry(source)
+    if registry is None:
+        avro_schema = _get_avro(source, canonical_name)
+        return DataSchema.from_avro(avro_schema) if avro_schema else None
+    return registry.get(
+        canonical_name, lambda: _get_avro_json(source, canonical_name), _get_schema_ttl_seconds(source, canonical_name)
+    )
+
+
 def _get_dal_canonical_name(source: DataSource) -> str:
     def helper(source: DataSource) -> List[str]:
         if source.cat is None:
@@ -209,19 +716,30 @@ def _get_dal_canonical_name(source: DataSource) -> str:
 
 
 def _get_avro(source: DataSource, canonical_name: str) -> Optional[Dict]:
+    avro_json = _get_avro_json(source, canonical_name)
+    return json.loads(avro_json) if avro_json else None
+
+
+def _get_avro_json(source: DataSource, canonical_name: str) -> Optional[str]:
     data_schema_entry = _get_metadata_schema(source)
     if data_schema_entry is None:
         return None
 
-    if "kafka_schema_registry" in data_schema_entry:
-        # TODO(talebz): check data_schema_entry for kafka_schema_registry.  If exists then query Kafka Schema Registry
-        raise NotImplementedError(
-            "kafka_schema_registry integration not yet supported.  "
-            f"Please put schema as {canonical_name}: > JSON of avro schema"
-        )
-
     if canonical_name in data_schema_entry:
-        return json.loads(data_schema_entry[canonical_name])
+        return data_schema_entry[canonical_name]
+    elif "kafka_schema_registry" in data_schema_entry:
+        return kafka_schema_registry.get_avro_json(data_schema_entry, canonical_name)
+    else:
+        return None
+
+
+def _get_schema_ttl_seconds(source: DataSource, canonical_name: str) -> Optional[float]:
+    """ :return: how long the schema of canonical_name may be memoized, None when it only changes with the catalog """
+    data_schema_entry = _get_metadata_schema(source)
+    if data_schema_entry is None or canonical_name in data_schema_entry:
+        return None
+    elif "kafka_schema_registry" in data_schema_entry:
+        return kafka_schema_registry.get_ttl_seconds(data_schema_entry, canonical_name)
     else:
         return None
 
@@ -233,23 +751,25 @@ def _get_metadata_schema(source: DataSource) -> Dict:
         return _get_metadata_schema(source.cat)
 
 
+AVRO_TYPE_TO_DTYPE = {
+    tuple(sorted(["type", "long", "logicalType", "timestamp-millis"])): np.dtype("datetime64"),
+    tuple(sorted(["type", "long", "logicalType", "timestamp-micros"])): np.dtype("datetime64"),
+    tuple(sorted(["null", "int"])): np.dtype("int32"),
+    tuple(sorted(["null", "long"])): np.dtype("int64"),
+    tuple(sorted(["type", "int", "unsigned", "True"])): np.dtype("uint32"),
+    tuple(sorted(["type", "long", "unsigned", "True"])): np.dtype("int64"),
+    tuple(["long"]): np.dtype("int64"),
+    tuple(["int"]): np.dtype("int32"),
+    tuple(["float"]): np.dtype("float32"),
+    tuple(["double"]): np.dtype("float64"),
+    tuple(["boolean"]): np.dtype("bool"),
+    tuple(["string"]): np.dtype("object"),
+}
+
+
 # TODO(talebz): ensure this is comprehensive with unit tests!
 def _avro_to_dtype(schema: Dict) -> Dict:
     field_schemas = {f["name"]: f["type"] for f in schema["fields"]}
-    avro_type_to_dtype = {
-        tuple(sorted(["type", "long", "logicalType", "timestamp-millis"])): np.dtype("datetime64"),
-        tuple(sorted(["type", "long", "logicalType", "timestamp-micros"])): np.dtype("datetime64"),
-        tuple(sorted(["null", "int"])): np.dtype("int32"),
-        tuple(sorted(["null", "long"])): np.dtype("int32"),
-        tuple(sorted(["type", "int", "unsigned", "True"])): np.dtype("uint32"),
-        tuple(sorted(["type", "long", "unsigned", "True"])): np.dtype("int64"),
-        tuple(["long"]): np.dtype("int64"),
-        tuple(["int"]): np.dtype("int32"),
-        tuple(["float"]): np.dtype("float32"),
-        tuple(["double"]): np.dtype("float64"),
-        tuple(["boolean"]): np.dtype("bool"),
-        tuple(["string"]): np.dtype("object"),
-    }
 
     def to_lookup(avro_type: Union[str, list]) -> tuple:
         if isinstance(avro_type, str):
@@ -260,14 +780,14 @@ def _avro_to_dtype(schema: Dict) -> Dict:
     ret = {}
     for (k, v) in field_schemas.items():
         lookup = to_lookup(v)
-        if lookup in avro_type_to_dtype:
-            ret[k] = avro_type_to_dtype[lookup]
+        if lookup in AVRO_TYPE_TO_DTYPE:
+            ret[k] = AVRO_TYPE_TO_DTYPE[lookup]
         elif "null" in lookup:
             list_lookup = list(lookup)
             list_lookup.remove("null")
             new_lookup = tuple(list_lookup)
-            if new_lookup in avro_type_to_dtype:
-                ret[k] = avro_type_to_dtype[new_lookup]
+            if new_lookup in AVRO_TYPE_TO_DTYPE:
+                ret[k] = AVRO_TYPE_TO_DTYPE[new_lookup]
             else:
                 raise ValueError(f"{lookup} to pandas type not supported in {schema}")
         else:
@@ -276,6 +796,201 @@ def _avro_to_dtype(schema: Dict) -> Dict:
     return ret
 
 
+Filters = List[List[Tuple[str, str, object]]]
+
+FILTER_OPERATORS = {
+    "==": operator.eq,
+    "=": operator.eq,
+    "!=": operator.ne,
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+    "in": lambda series, values: series.isin(values),
+    "not in": lambda series, values: ~series.isin(values),
+}
+
+
+def _normalize_filters(filters: Optional[list]) -> Optional[Filters]:
+    """ :return: filters in disjunctive normal form of tuples, YAML gives lists """
+    if not filters:
+        return None
+    if isinstance(filters[0][0], str):
+        filters = [filters]
+    return [[tuple(predicate) for predicate in conjunction] for conjunction in filters]
+
+
+def _validate_read_options(avro_schema: Optional[Dict], columns: Optional[List[str]], filters: Optional[Filters]):
+    for conjunction in filters or []:
+        for predicate in conjunction:
+            if len(predicate) != 3 or predicate[1] not in FILTER_OPERATORS:
+                raise ValueError(
+                    f"invalid filter {predicate}, expected (column, op, value) with op in {list(FILTER_OPERATORS)}"
+                )
+    if avro_schema:
+        fields = {f["name"] for f in avro_schema["fields"]}
+        filter_columns = [column for conjunction in filters or [] for column, _, _ in conjunction]
+        unknown = [column for column in (columns or []) + filter_columns if column not in fields]
+        if unknown:
+            raise ValueError(f"columns {unknown} are not in the Avro schema fields {sorted(fields)}")
+
+
+def _validate_storage_modes(storage: Dict, storage_modes: List[str], argument: str):
+    unknown = [storage_mode for storage_mode in storage_modes if storage_mode not in storage]
+    if unknown:
+        raise ValueError(f"{argument} storage modes {unknown} not in {list(storage)}")
+
+
+def _validate_storage_chain(
+    storage: Dict,
+    storage_chain: Optional[List[str]],
+    backfill: bool,
+    columns: Optional[List[str]],
+    filters: Optional[Filters],
+):
+    _validate_storage_modes(storage, storage_chain or [], "storage_chain")
+    if storage_chain and backfill and (columns is not None or filters):
+        raise ValueError("backfill would write partial rows, it can't be combined with columns or filters")
+
+
+def _storage_mode_url(mode: Union[str, Dict]) -> ParseResult:
+    return urlparse(mode["url"] if isinstance(mode, dict) else mode)
+
+
+def _chain_key_column(storage: Dict, storage_chain: List[str]) -> Optional[str]:
+    """ :return: the key column of the first key value storage mode of the chain """
+    for storage_mode in storage_chain:
+        url = _storage_mode_url(storage[storage_mode])
+        if url.scheme in KEY_VALUE_DRIVERS:
+            return url.fragment or KEY_VALUE_DRIVERS[url.scheme]
+    return None
+
+
+def _tier_key_column(mode: Union[str, Dict], chain_key_column: str) -> str:
+    """ :return: the key column of a key value storage mode, the one of the chain for the others """
+    url = _storage_mode_url(mode)
+    if url.scheme in KEY_VALUE_DRIVERS:
+        return url.fragment or KEY_VALUE_DRIVERS[url.scheme]
+    return chain_key_column
+
+
+def _rows_of_keys(df: pd.DataFrame, key_column: str, keys: List) -> Dict[str, pd.DataFrame]:
+    """ :return: the rows of each key of keys found in df, by str key, empty rows are misses """
+    df = df.dropna(how="all")
+    if key_column not in df or len(df) == 0:
+        return {}
+    key_values = df[key_column]
+    if key_values.dtype.kind == "f" and (key_values % 1 == 0).all():
+        # the empty rows of missing keys made integer keys floats
+        key_values = key_values.astype(np.int64)
+    wanted = {str(k) for k in keys}
+    return {k: rows for k, rows in df.groupby(key_values.astype(str), sort=False) if k in wanted}
+
+
+def _filter_mask(df: pd.DataFrame, filters: Filters) -> np.ndarray:
+    mask = np.zeros(len(df), dtype=bool)
+    for conjunction in filters:
+        conjunction_mask = np.ones(len(df), dtype=bool)
+        for column, op, value in conjunction:
+            conjunction_mask &= np.asarray(FILTER_OPERATORS[op](df[column], value), dtype=bool)
+        mask |= conjunction_mask
+    return mask
+
+
+def _backfill(sources: List[DalSource], df: pd.DataFrame):
+    for source in sources:
+        try:
+            source.write(df)
+        except Exception as e:
+            logger.warning("%s backfill of %s failed: %r", source.name, source.storage_mode, e)
+
+
+def _backfill_keys(missed: List[Tuple[DalSource, List]], rows: Dict[str, pd.DataFrame]):
+    """ Writes to each source the rows a lower storage mode had of the keys it missed. """
+    for source, keys in missed:
+        found = [rows[str(k)] for k in dict.fromkeys(keys) if str(k) in rows]
+        if found:
+            _backfill([source], pd.concat(found, ignore_index=True))
+
+
+def _timed_write(source: DalSource, df: pd.DataFrame) -> WriteResult:
+    start = time.perf_counter()
+    try:
+        result, error = source.write(df), None
+    except Exception as e:
+        result, error = None, e
+    return WriteResult(source.storage_mode, time.perf_counter() - start, result, error)
+
+
+def _executor(max_workers: Optional[int], processes: bool) -> Executor:
+    if not processes:
+        return ThreadPoolExecutor(max_workers=max_workers)
+    if sys.version_info < (3, 7):
+        return ProcessPoolExecutor(max_workers=max_workers)
+    # forking a process that runs pyarrow or dask threads may deadlock the workers
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn"))
+
+
+def _read_partition(source: DataSource, i: int, **read_options) -> pd.DataFrame:
+    return _apply_read_options(source.read_partition(i), **read_options)
+
+
+def _apply_read_options(
+    df: pd.DataFrame,
+    columns: Optional[List[str]] = None,
+    filters: Optional[Filters] = None,
+    schema_dtypes: Optional[Dict[str, np.dtype]] = None,
+    category_threshold: Optional[float] = None,
+) -> pd.DataFrame:
+    """ Exact filtering, projection and dtypes of the rows read, whatever the backend pushed down. """
+    if filters:
+        df = df[_filter_mask(df, filters)]
+    if columns is not None:
+        df = df[columns]
+    if schema_dtypes:
+        df = _enforce_dtypes(df, schema_dtypes, category_threshold)
+    return df
+
+
+def _enforce_dtypes(
+    df: pd.DataFrame, schema_dtypes: Dict[str, np.dtype], category_threshold: Optional[float] = None
+) -> pd.DataFrame:
+    """ Casts the columns of df to their Avro schema dtypes, see DalSource enforce_dtypes. """
+    casts = {}
+    for column, dtype in schema_dtypes.items():
+        if column in df:
+            cast = _enforce_dtype(df[column], dtype, category_threshold)
+            if cast is not None:
+                casts[column] = cast
+    return df.assign(**casts) if casts else df
+
+
+def _enforce_dtype(series: pd.Series, dtype: np.dtype, category_threshold: Optional[float]) -> Optional[pd.Series]:
+    """ :return: series cast to dtype, None when it is left as is """
+    if dtype.kind == "O":
+        if category_threshold is not None and series.nunique() <= category_threshold * len(series):
+            return series.astype("category")
+    elif dtype.kind == "M":
+        if series.dtype.kind != "M":
+            return pd.to_datetime(series)
+    elif series.dtype != dtype and not (dtype.kind in "iub" and series.isnull().any()) and _fits_dtype(series, dtype):
+        # only floats and objects can hold nulls, values the dtype would change are left as is
+        return series.astype(dtype)
+    return None
+
+
+def _non_nullable_float_dtypes(avro_schema: Dict, schema_dtypes: Dict[str, np.dtype]) -> Dict[str, str]:
+    """
+    :return: the float dtypes of the fields that are not a union with null.  read_csv would wrap
+        out of range integers and fail on blank integer or boolean cells, those are cast after the read.
+    """
+    return {
+        f["name"]: str(schema_dtypes[f["name"]])
+        for f in avro_schema["fields"]
+        if not isinstance(f["type"], list) and schema_dtypes[f["name"]].kind == "f"
+    }
+
+
 def _flatten(ls: Iterable) -> Iterable:
     def iter_ls():
         if isinstance(ls, dict):
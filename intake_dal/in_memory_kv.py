@@ -1,7 +1,127 @@
+"""
+In-memory key value store standing in for the Online Feature Store, eg: in tests and local runs.
+
+    storage:
+      serving: 'in-memory-kvs://user_events#userid'
+
+The url path names the table and the optional fragment its key column, "key" by default.
+A table keyed by a column of the dataset Avro schema has the schema columns and dtypes,
+the other tables take the columns written to them.
+"""
+import threading
+from collections.abc import Iterable
+from typing import Dict, Hashable, List, Optional
+from urllib.parse import urldefrag
+
+import numpy as np
 import pandas as pd
 import pkg_resources
 from intake import DataSource, Schema
 
+from intake_dal.dal_online import DalOnlineSource, _apply_dtypes
+
+
+DEFAULT_KEY_COLUMN = "key"
+MIN_CAPACITY = 16
+
+
+class KVTable:
+    """
+    Thread safe table of columnar rows with a hash index from key to row position,
+    so getting and upserting keys costs O(keys) whatever the number of rows.
+    """
+
+    def __init__(self, key_column: str, dtypes: Optional[Dict[str, str]] = None):
+        """
+        :param dtypes: the columns of the table and their dtypes, eg: of an Avro schema.
+            By default the columns are the ones written.
+        """
+        self.key_column = key_column
+        self.dtypes = dtypes
+        self._positions: Dict[Hashable, int] = {}
+        self._columns: Dict[str, np.ndarray] = {
+            column: np.empty(0, dtype=_numpy_dtype(dtype)) for column, dtype in (dtypes or {}).items()
+        }
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._size
+
+    def get(self, keys: Optional[List[Hashable]] = None) -> pd.DataFrame:
+        """ :return: the rows of keys in keys order, skipping the missing keys, or all the rows """
+        with self._lock:
+            if keys is None:
+                positions = np.arange(self._size)
+            else:
+                positions = np.fromiter((self._positions[k] for k in keys if k in self._positions), dtype=np.int64)
+            return pd.DataFrame({column: values[positions] for column, values in self._columns.items()})
+
+    def upsert(self, df: pd.DataFrame) -> int:
+        """
+        Inserts the rows of new keys and overwrites the written columns of existing keys,
+        the last row of a key written twice wins.
+
+        :return: the number of keys written
+        """
+        if self.key_column not in df:
+            raise KeyError(f"key column {self.key_column} missing from {list(df.columns)}")
+        if self.dtypes is not None:
+            unknown = [column for column in df.columns if column not in self.dtypes]
+            if unknown:
+                raise ValueError(f"columns {unknown} not in the table columns {list(self.dtypes)}")
+            df = _apply_dtypes(df.copy(), self.dtypes, DalOnlineSource.DATE_TIME_FORMAT)
+        df = df.drop_duplicates(self.key_column, keep="last")
+        keys = df[self.key_column].tolist()
+
+        with self._lock:
+            positions = np.fromiter((self._positions.get(k, -1) for k in keys), dtype=np.int64, count=len(keys))
+            new = positions < 0
+            positions[new] = np.arange(self._size, self._size + int(new.sum()))
+            self._reserve(self._size + int(new.sum()))
+            for column in df.columns:
+                self._set(column, positions, np.asarray(df[column]))
+            for column in self._columns.keys() - set(df.columns):
+                self._set_missing(column, positions[new])
+            self._positions.update(zip((k for k, is_new in zip(keys, new) if is_new), positions[new].tolist()))
+            self._size += int(new.sum())
+        return len(keys)
+
+    def _reserve(self, size: int):
+        capacity = len(next(iter(self._columns.values()), []))
+        if size <= capacity:
+            return
+        # doubling keeps appends amortized O(1)
+        capacity = max(size, 2 * capacity, MIN_CAPACITY)
+        for column, values in self._columns.items():
+            grown = np.empty(capacity, dtype=values.dtype)
+            grown[: self._size] = values[: self._size]
+            self._columns[column] = grown
+
+    def _set(self, column: str, positions: np.ndarray, values: np.ndarray):
+        current = self._columns.get(column)
+        if current is None:
+            # a new column, the existing rows don't have it
+            capacity = len(next(iter(self._columns.values()), positions))
+            current = np.empty(capacity, dtype=values.dtype)
+            self._columns[column] = current
+            self._set_missing(column, np.arange(self._size))
+            current = self._columns[column]
+
+        dtype = _common_dtype(current.dtype, values.dtype)
+        if dtype != current.dtype:
+            current = self._columns[column] = current.astype(dtype)
+        current[positions] = values
+
+    def _set_missing(self, column: str, positions: np.ndarray):
+        if len(positions) == 0:
+            return
+        current = self._columns[column]
+        dtype = _nullable_dtype(current.dtype)
+        if dtype != current.dtype:
+            current = self._columns[column] = current.astype(dtype)
+        current[positions] = np.datetime64("NaT") if dtype.kind == "M" else np.nan if dtype.kind == "f" else None
+
 
 class InMemoryKVSource(DataSource):
     container = "dataframe"
@@ -9,16 +129,38 @@ class InMemoryKVSource(DataSource):
     partition_access = False
     name = "in-memory-kvs"
 
+    # initial rows of the tables keyed by "key" without an Avro schema
     db = pd.DataFrame({"key": ["first", "second", "third", "fourth"], "value": [1, 2, 3, 4]})
 
+    # the tables by url path, shared by all the sources of the process
+    tables: Dict[str, KVTable] = {}
+    _tables_lock = threading.Lock()
+
     def __init__(self, urlpath="", key=None, storage_options=None, metadata=None):
+        """
+        Args:
+            urlpath: the table name, optionally followed by the key column as a fragment.
+            key: a key value or a list of them, all the rows by default.
+            storage_options: unused
+            metadata: Used by Intake, the dtypes of a DalSource Avro schema apply to the table
+        """
         # store important kwargs
         self._urlpath = urlpath
+        self._table_name, fragment = urldefrag(urlpath)
+        self._key_column = fragment or DEFAULT_KEY_COLUMN
         self._key = key
+        self._table = None  # set in _get_table()
         super(InMemoryKVSource, self).__init__(metadata=metadata)
 
+    def _rebind(self, key=None):
+        self._key = key
+
     def _get_schema(self):
-        self._dtypes = {"key": "object", "value": "object"}
+        table = self._get_table()
+        if table.dtypes is not None:
+            self._dtypes = dict(table.dtypes)
+        else:
+            self._dtypes = {column: str(dtype) for column, dtype in table.get([]).dtypes.items()}
 
         return Schema(
             datashape=None,
@@ -29,17 +171,57 @@ class InMemoryKVSource(DataSource):
         )
 
     def _get_partition(self, _) -> pd.DataFrame:
-        if self._key:
-            return InMemoryKVSource.db[self.db.key == self._key]
-        else:
-            return InMemoryKVSource.db
+        if self._key is None:
+            return self._get_table().get()
+        multi_key = isinstance(self._key, Iterable) and not isinstance(self._key, str)
+        return self._get_table().get(list(self._key) if multi_key else [self._key])
 
-    def write(self, df: pd.DataFrame):
-        new_db = pd.merge(InMemoryKVSource.db, df, on="key", how="outer")
-        new_db["value"] = new_db["value_y"].fillna(new_db["value_x"]).astype("int")
+    def write(self, df: pd.DataFrame) -> int:
+        """ Upserts the rows of df by key, see KVTable.upsert(). """
+        return self._get_table().upsert(df)
 
-        InMemoryKVSource.db = new_db[["key", "value"]]
-        return InMemoryKVSource.db
+    def _get_table(self) -> KVTable:
+        if self._table is None:
+            self._table = _get_table(self._table_name, self._key_column, self.metadata.get("dtypes"))
+        return self._table
 
     def _close(self):
         pass
+
+
+def _get_table(name: str, key_column: str, schema_dtypes: Optional[Dict[str, str]]) -> KVTable:
+    with InMemoryKVSource._tables_lock:
+        table = InMemoryKVSource.tables.get(name)
+        if table is None:
+            if schema_dtypes and key_column in schema_dtypes:
+                table = KVTable(key_column, schema_dtypes)
+            else:
+                table = KVTable(key_column)
+                if key_column == DEFAULT_KEY_COLUMN:
+                    table.upsert(InMemoryKVSource.db)
+            InMemoryKVSource.tables[name] = table
+    if table.key_column != key_column:
+        raise ValueError(f"in-memory-kvs table {name} is keyed by {table.key_column}, not {key_column}")
+    return table
+
+
+def _numpy_dtype(dtype: str) -> np.dtype:
+    # Avro timestamps are "datetime64" dtypes
+    return np.dtype("datetime64[ns]") if dtype.startswith("datetime64") else np.dtype(dtype)
+
+
+def _common_dtype(current: np.dtype, written: np.dtype) -> np.dtype:
+    if current == written:
+        return current
+    if current.kind in "biuf" and written.kind in "biuf":
+        return np.promote_types(current, written)
+    if current.kind == "M" and written.kind == "M":
+        return np.dtype("datetime64[ns]")
+    return np.dtype(object)
+
+
+def _nullable_dtype(dtype: np.dtype) -> np.dtype:
+    """ The dtype holding dtype values and missing values, like pandas does. """
+    if dtype.kind in "iuf":
+        return np.promote_types(dtype, np.float64) if dtype.kind != "f" else dtype
+    return dtype if dtype.kind in "MO" else np.dtype(object)
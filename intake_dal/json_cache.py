@@ -0,0 +1,24 @@
+"""
+JSON entries of the local disk caches, eg: the parsed catalogs and the schema registry schemas.
+"""
+import json
+import os
+from pathlib import Path
+from typing import Any, Optional
+
+
+def read_entry(cache_path: Path) -> Optional[Any]:
+    """ :return: the cached data, None when the entry is missing or corrupt so it's built again """
+    try:
+        with open(cache_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_entry(cache_path: Path, data: Any):
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, cache_path)  # concurrent processes never read a partial entry
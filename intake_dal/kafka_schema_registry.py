@@ -0,0 +1,106 @@
+"""
+Avro schemas of a Confluent compatible Kafka schema registry, cached on local disk by registry url,
+subject and version so process restarts don't query the registry for every dataset.
+
+    metadata:
+      data_schema:
+        kafka_schema_registry: http://schema-registry:8081
+        # optional, the subject of a dataset defaults to its canonical name
+        kafka_schema_registry_subject: "{canonical_name}-value"
+        kafka_schema_registry_versions:
+          entity.user.user_events: 3
+        kafka_schema_registry_cache_dir: ~/.cache/intake-dal/schemas
+        kafka_schema_registry_ttl_seconds: 3600
+
+Registered versions never change and are cached forever, the latest version is revalidated
+once its cache entry is older than the TTL.  A stale entry is served when the registry can't
+be reached.  The catalogs also resolve the latest version again once it's older than the TTL.
+"""
+import hashlib
+import time
+import urllib.parse
+from http import HTTPStatus
+from pathlib import Path
+from typing import Dict, Optional, Union
+
+import requests
+
+from intake_dal import json_cache
+from intake_dal.dal_online import _http_session
+
+
+DEFAULT_CACHE_DIR = "~/.cache/intake-dal/schemas"
+DEFAULT_TTL_SECONDS = 3600
+LATEST = "latest"
+SCHEMA_REGISTRY_CONTENT_TYPE = "application/vnd.schemaregistry.v1+json"
+
+
+class SchemaRegistryError(Exception):
+    """ The schema registry answered with an unexpected status code. """
+
+
+class KafkaSchemaRegistry:
+    def __init__(self, url: str, cache_dir: str = DEFAULT_CACHE_DIR, ttl_seconds: float = DEFAULT_TTL_SECONDS):
+        self.url = url.rstrip("/") + "/"
+        self.cache_dir = Path(cache_dir).expanduser() / hashlib.sha256(self.url.encode("utf-8")).hexdigest()[:16]
+        self.ttl_seconds = ttl_seconds
+
+    def get_schema(self, subject: str, version: Union[int, str] = LATEST) -> Optional[str]:
+        """ :return: the Avro schema JSON of subject at version, None when the registry doesn't have it """
+        cache_path = self._cache_path(subject, version)
+        cached = json_cache.read_entry(cache_path)
+        fresh = cached is not None and time.time() - cached.get("fetched_at", 0) < self.ttl_seconds
+        # registered versions never change, only the latest one is revalidated
+        if cached is not None and (str(version) != LATEST or fresh):
+            return cached["schema"]
+
+        try:
+            fetched = self._fetch(subject, version)
+        except (requests.RequestException, SchemaRegistryError):
+            if cached is not None:
+                return cached["schema"]
+            raise
+        if fetched is None:
+            return None
+
+        fetched["fetched_at"] = time.time()
+        json_cache.write_entry(cache_path, fetched)
+        if str(version) == LATEST and "version" in fetched:
+            json_cache.write_entry(self._cache_path(subject, fetched["version"]), fetched)
+        return fetched["schema"]
+
+    def _fetch(self, subject: str, version: Union[int, str]) -> Optional[Dict]:
+        settings, session = _http_session(self.url)
+        response = session.get(
+            urllib.parse.urljoin(self.url, f"subjects/{urllib.parse.quote(subject, safe='')}/versions/{version}"),
+            headers={"Accept": SCHEMA_REGISTRY_CONTENT_TYPE},
+            timeout=settings.timeout_seconds,
+        )
+        if response.status_code == HTTPStatus.NOT_FOUND.value:
+            return None
+        if response.status_code != HTTPStatus.OK.value:
+            raise SchemaRegistryError(f"url={response.url} code={response.status_code}: {response.text}")
+        return response.json()
+
+    def _cache_path(self, subject: str, version: Union[int, str]) -> Path:
+        return self.cache_dir / f"{urllib.parse.quote(subject, safe='')}.{version}.json"
+
+
+def get_avro_json(data_schema_entry: Dict, canonical_name: str) -> Optional[str]:
+    """ :return: the Avro schema JSON of canonical_name from the kafka_schema_registry of data_schema_entry """
+    registry = KafkaSchemaRegistry(
+        data_schema_entry["kafka_schema_registry"],
+        cache_dir=data_schema_entry.get("kafka_schema_registry_cache_dir", DEFAULT_CACHE_DIR),
+        ttl_seconds=data_schema_entry.get("kafka_schema_registry_ttl_seconds", DEFAULT_TTL_SECONDS),
+    )
+    subject = data_schema_entry.get("kafka_schema_registry_subject", "{canonical_name}")
+    version = (data_schema_entry.get("kafka_schema_registry_versions") or {}).get(canonical_name, LATEST)
+    return registry.get_schema(subject.format(canonical_name=canonical_name), version)
+
+
+def get_ttl_seconds(data_schema_entry: Dict, canonical_name: str) -> Optional[float]:
+    """ :return: how long the schema of canonical_name stays current, None for a registered version """
+    version = (data_schema_entry.get("kafka_schema_registry_versions") or {}).get(canonical_name, LATEST)
+    if str(version) != LATEST:
+        return None
+    return data_schema_entry.get("kafka_schema_registry_ttl_seconds", DEFAULT_TTL_SECONDS)
@@ -0,0 +1,66 @@
+import threading
+import time
+from typing import Optional
+
+
+class TokenBucket:
+    """
+    Thread safe token bucket refilled continuously at `rate` tokens per second
+    up to `capacity` tokens.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        if rate <= 0:
+            raise ValueError(f"rate must be positive, got {rate}")
+        self.rate = float(rate)
+        self.capacity = float(capacity) if capacity else max(1.0, self.rate)
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def reserve(self, tokens: float) -> float:
+        """
+        Takes `tokens` out of the bucket and returns how many seconds the caller must wait
+        before using them.  Requests larger than the capacity are allowed and put the bucket
+        into debt, which delays the following callers.
+        """
+        with self._lock:
+            self._refill()
+            self._tokens -= tokens
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+
+class RateLimiter:
+    """
+    Paces writes by rows per second and requests per second against elapsed time.
+    One instance is meant to be shared by all the concurrent writers of a source.
+    """
+
+    def __init__(
+        self,
+        rows_per_second: Optional[float] = None,
+        requests_per_second: Optional[float] = None,
+        requests_burst: Optional[float] = None,
+    ):
+        self._rows = TokenBucket(rows_per_second) if rows_per_second else None
+        self._requests = TokenBucket(requests_per_second, requests_burst) if requests_per_second else None
+
+    def acquire(self, rows: int = 0):
+        """ Blocks until a request of `rows` rows is allowed. """
+        delay = self.reserve(rows)
+        if delay > 0:
+            time.sleep(delay)
+
+    def reserve(self, rows: int = 0) -> float:
+        """ :return: how many seconds to wait before a request of `rows` rows, eg: with asyncio.sleep() """
+        delay = 0.0
+        if self._requests:
+            delay = max(delay, self._requests.reserve(1))
+        if self._rows:
+            delay = max(delay, self._rows.reserve(rows))
+        return delay
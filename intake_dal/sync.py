@@ -0,0 +1,174 @@
+"""
+Incremental sync of a data set from one storage mode to another, eg: batch -> serving.
+
+A per key content hash of the last synced rows is persisted in a local manifest so the
+next sync only writes the new or changed keys.
+
+    python -m intake_dal.sync catalog.yaml entity.user.user_events --source batch --target serving
+"""
+import argparse
+import hashlib
+import os
+from pathlib import Path
+from typing import Iterator, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from intake import Catalog, DataSource
+
+from intake_dal.dal_catalog import DalCatalog
+
+
+DEFAULT_MANIFEST_DIR = Path("~/.cache/intake-dal/sync")
+
+
+class SyncResult(NamedTuple):
+    rows_read: int
+    rows_written: int
+    write_result: Optional[list]
+    manifest_path: str
+
+
+class Manifest:
+    """ Content hash by key of the rows written by the last sync, persisted as parquet. """
+
+    def __init__(self, keys: Optional[pd.Index] = None, hashes: Optional[np.ndarray] = None):
+        keys = keys if keys is not None else pd.Index([], dtype=object)
+        hashes = hashes if hashes is not None else np.array([], dtype=np.uint64)
+        # the last row of a duplicated key wins like it does when written
+        last = ~keys.duplicated(keep="last")
+        self.hashes = pd.Series(hashes[last], index=keys[last])
+
+    @staticmethod
+    def load(path: str) -> "Manifest":
+        if not os.path.exists(path):
+            return Manifest()
+        df = pd.read_parquet(path)
+        return Manifest(pd.Index(df["key"].values), df["hash"].values)
+
+    def save(self, path: str):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        pd.DataFrame({"key": self.hashes.index.values, "hash": self.hashes.values}).to_parquet(tmp_path)
+        os.replace(tmp_path, path)  # a failed save leaves the previous manifest intact
+
+    def changed(self, keys: pd.Index, hashes: np.ndarray) -> np.ndarray:
+        """ :return: mask of the rows whose key is new or whose hash differs from the manifest """
+        positions = self.hashes.index.get_indexer(keys)
+        known = positions >= 0
+        changed = ~known
+        changed[known] = self.hashes.values[positions[known]] != hashes[known]
+        return changed
+
+
+def row_hashes(df: pd.DataFrame) -> np.ndarray:
+    """ Stable across processes, pandas hashes with a fixed key. """
+    return pd.util.hash_pandas_object(df, index=False).values
+
+
+def sync(
+    catalog: Catalog,
+    dataset: str,
+    source_storage_mode: str = "batch",
+    target_storage_mode: str = "serving",
+    manifest_path: Optional[str] = None,
+    key_name: Optional[str] = None,
+) -> SyncResult:
+    """
+    Writes the rows of dataset whose key is new or changed since the last sync from
+    source_storage_mode to target_storage_mode.
+
+    The source is read chunk by chunk twice: the first pass hashes the rows and keeps the last
+    row of every key across all the chunks, the second pass writes the changed ones.
+
+    :param catalog: catalog containing the dal dataset
+    :param dataset: canonical name of the dataset, eg: entity.user.user_events
+    :param manifest_path: defaults to ~/.cache/intake-dal/sync/<dataset>.<source>.<target>.<hash>.parquet
+        where hash is the one of the source and target url paths.
+    :param key_name: key column, defaults to the target source key, eg: the dal-online url fragment.
+    :return: SyncResult
+    """
+    source = catalog[dataset](storage_mode=source_storage_mode)
+    target = catalog[dataset](storage_mode=target_storage_mode)
+    if key_name is None:
+        target._get_source()
+        key_name = getattr(target.source, "key_name", None)
+        if key_name is None:
+            raise ValueError(f"key_name is required to sync to {target_storage_mode} storage of {dataset}")
+
+    if manifest_path is None:
+        name = f"{dataset}.{source_storage_mode}.{target_storage_mode}.{_urls_hash(source, target)}.parquet"
+        manifest_path = str((DEFAULT_MANIFEST_DIR / name).expanduser())
+    manifest = Manifest.load(manifest_path)
+
+    chunk_lengths, keys, hashes = _keys_and_hashes(source, key_name)
+    # the target keeps the last row of a key, only that row is compared and written
+    write = ~keys.duplicated(keep="last")
+    write[write] = manifest.changed(keys[write], hashes[write])
+    offsets = np.cumsum([0] + chunk_lengths)
+
+    def changed_frames() -> Iterator[pd.DataFrame]:
+        for i, frame in enumerate(source.read_chunked()):
+            if i >= len(chunk_lengths) or len(frame) != chunk_lengths[i]:
+                raise ValueError(f"{source_storage_mode} storage of {dataset} changed during the sync")
+            changed = write[offsets[i]:offsets[i + 1]]
+            if changed.any():
+                yield frame[changed]
+
+    write_result = target.write_chunked(changed_frames())
+
+    # the manifest is only updated once everything is written, keys missing from the source are dropped
+    Manifest(keys, hashes).save(manifest_path)
+    return SyncResult(int(offsets[-1]), int(write.sum()), write_result, manifest_path)
+
+
+def _keys_and_hashes(source: DataSource, key_name: str) -> Tuple[List[int], pd.Index, np.ndarray]:
+    """ :return: the length of every chunk of source with the keys and row hashes of all the chunks """
+    chunk_lengths: List[int] = []
+    chunk_keys: List[np.ndarray] = []
+    chunk_hashes: List[np.ndarray] = []
+    for frame in source.read_chunked():
+        chunk_lengths.append(len(frame))
+        chunk_keys.append(frame[key_name].astype(str).values)
+        chunk_hashes.append(row_hashes(frame))
+    if not chunk_lengths:
+        return [], pd.Index([], dtype=object), np.array([], dtype=np.uint64)
+    return chunk_lengths, pd.Index(np.concatenate(chunk_keys), dtype=object), np.concatenate(chunk_hashes)
+
+
+def _urls_hash(source: DataSource, target: DataSource) -> str:
+    """ Syncs between other urls of the same storage modes, eg: of another catalog, don't share a manifest. """
+    url_paths = []
+    for dal_source in (source, target):
+        dal_source._get_source()
+        url_paths.append(dal_source.source.metadata["url_path"])
+    return hashlib.sha256("\n".join(url_paths).encode()).hexdigest()[:16]
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Incrementally sync a dal dataset between storage modes.")
+    parser.add_argument("catalog", help="path of the catalog YAML")
+    parser.add_argument("dataset", help="canonical name of the dataset, eg: entity.user.user_events")
+    parser.add_argument("--source", default="batch", help="storage mode to read from")
+    parser.add_argument("--target", default="serving", help="storage mode to write to")
+    parser.add_argument("--manifest", default=None, help="path of the local sync manifest")
+    parser.add_argument("--key", default=None, help="key column, defaults to the target source key")
+    parsed = parser.parse_args(args)
+
+    result = sync(
+        DalCatalog(parsed.catalog),
+        parsed.dataset,
+        source_storage_mode=parsed.source,
+        target_storage_mode=parsed.target,
+        manifest_path=parsed.manifest,
+        key_name=parsed.key,
+    )
+    print(
+        f"{parsed.dataset}: {parsed.source} -> {parsed.target} "
+        f"read {result.rows_read} rows, wrote {result.rows_written} rows, manifest {result.manifest_path}"
+    )
+    return result
+
+
+if __name__ == "__main__":
+    main()
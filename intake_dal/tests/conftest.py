@@ -1,4 +1,7 @@
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
 from pathlib import Path
+from socketserver import ThreadingMixIn
 
 import pytest
 
@@ -18,3 +21,60 @@ def serving_cat(catalog_path: str):
 @pytest.fixture
 def cat(catalog_path: str):
     return DalCatalog(catalog_path)
+
+
+class StubHttpServer(ThreadingMixIn, HTTPServer):
+    """
+    Local HTTP server recording the requests it receives and answering with
+    `respond(request) -> (status_code, content_type, body)`.
+    """
+
+    daemon_threads = True
+    # concurrent clients, eg: asyncio fan outs, connect at once
+    request_queue_size = 64
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), StubHttpRequestHandler)
+        self.requests = []
+        self.respond = lambda request: (200, "application/json", b'{"data": []}')
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}/"
+
+
+class StubHttpRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+
+    def _handle(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request = {
+            "method": self.command,
+            "path": self.path,
+            "headers": dict(self.headers),
+            "body": self.rfile.read(length) if length else b"",
+            "client_address": self.client_address,
+        }
+        self.server.requests.append(request)
+        status, content_type, body = self.server.respond(request)
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = _handle
+    do_PUT = _handle
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def http_server():
+    server = StubHttpServer()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
@@ -0,0 +1,117 @@
+import io
+import json
+import tracemalloc
+
+import fastavro
+import numpy as np
+import pandas as pd
+import pandavro
+import pytest
+
+from intake_dal import avro_columnar
+
+
+def pandavro_bytes(df: pd.DataFrame, schema: dict) -> bytes:
+    with io.BytesIO() as bytes_io:
+        pandavro.to_avro(bytes_io, df.replace({np.nan: None}), schema=schema)
+        return bytes_io.getvalue()
+
+
+def sync_marker(avro_bytes: bytes) -> bytes:
+    return fastavro.reader(io.BytesIO(avro_bytes))._header["sync"]
+
+
+@pytest.fixture
+def user_events_schema(serving_cat):
+    return json.loads(serving_cat.metadata["data_schema"]["entity.user.user_events"])
+
+
+def test_serialize_is_byte_identical_to_pandavro(user_events_schema):
+    n = 3000  # several Avro blocks
+    df = pd.DataFrame(
+        {
+            "userid": np.arange(n) * 1000003 - 7,
+            "home_id": np.arange(n, dtype=np.int32),
+            "action": ["click", "vïew", ""] * (n // 3),
+            "timestamp": pd.date_range("1969-12-31 23:59:59.123456789", periods=n, freq="17333s"),
+        }
+    )
+    df.loc[3, "timestamp"] = pd.NaT
+
+    for chunk in [df, df.iloc[:1], df.iloc[:0]]:
+        expected = pandavro_bytes(chunk, user_events_schema)
+        assert avro_columnar.serialize(chunk, user_events_schema, sync_marker(expected)) == expected
+
+
+def test_serialize_primitive_types():
+    schema = {
+        "type": "record",
+        "name": "Root",
+        "fields": [
+            {"name": "f", "type": ["null", "float"]},
+            {"name": "d", "type": "double"},
+            {"name": "b", "type": "boolean"},
+            {"name": "s", "type": ["string", "null"]},
+            {"name": "i", "type": ["null", "int"]},
+            {"name": "t", "type": {"type": "long", "logicalType": "timestamp-micros"}},
+        ],
+    }
+    df = pd.DataFrame(
+        {
+            "f": [1.5, np.nan, -3.25],
+            "d": [1e300, -0.0, 7.0],
+            "b": [True, False, True],
+            "s": ["a", None, ""],
+            "i": np.array([-(2 ** 31), 0, 2 ** 31 - 1]),
+            "t": pd.to_datetime(["2020-01-01 00:00:00.123456789", "1969-12-31 23:59:59.5", "2001-02-03"]),
+        }
+    )
+    expected = pandavro_bytes(df, schema)
+    assert avro_columnar.serialize(df, schema, sync_marker(expected)) == expected
+
+
+def test_serialize_memory_with_skewed_string_lengths(user_events_schema):
+    n = 5000
+    df = pd.DataFrame(
+        {
+            "userid": np.arange(n),
+            "home_id": np.arange(n, dtype=np.int32),
+            "action": ["x" * 100_000] + ["click"] * (n - 1),
+            "timestamp": pd.date_range("2019-08-12", periods=n, freq="s"),
+        }
+    )
+    expected = pandavro_bytes(df, user_events_schema)
+
+    tracemalloc.start()
+    try:
+        avro_bytes = avro_columnar.serialize(df, user_events_schema, sync_marker(expected))
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert avro_bytes == expected
+    # proportional to the encoded size, padding the rows to the longest string would take 500MB
+    assert peak < 10 * 2 ** 20
+
+
+@pytest.mark.parametrize(
+    "avro_type, values",
+    [
+        ("long", [1, None]),  # nulls in a non nullable field
+        (["null", "int", "string"], [1, 2]),  # union of several types
+        ({"type": "array", "items": "int"}, [[1], [2]]),
+        ("string", [1, "a"]),
+        ("int", [2 ** 40, 1]),
+        ("long", np.array([2 ** 63, 1], dtype=np.uint64)),  # would wrap to a negative long
+    ],
+)
+def test_serialize_unsupported(avro_type, values):
+    schema = {"type": "record", "name": "Root", "fields": [{"name": "a", "type": avro_type}]}
+    with pytest.raises(avro_columnar.UnsupportedAvroSchema):
+        avro_columnar.serialize(pd.DataFrame({"a": values}), schema)
+
+
+def test_serialize_uint64_long_range():
+    schema = {"type": "record", "name": "Root", "fields": [{"name": "a", "type": "long"}]}
+    df = pd.DataFrame({"a": np.array([2 ** 63 - 1, 0], dtype=np.uint64)})
+    avro_bytes = avro_columnar.serialize(df, schema)
+    assert [r["a"] for r in fastavro.reader(io.BytesIO(avro_bytes))] == [2 ** 63 - 1, 0]
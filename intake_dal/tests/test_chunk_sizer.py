@@ -0,0 +1,39 @@
+import pandas as pd
+import pytest
+
+from intake_dal.chunk_sizer import AdaptiveChunkSizer
+
+
+def test_chunk_sizer_grows_towards_target_bytes():
+    sizer = AdaptiveChunkSizer(initial_size=10, max_size=1000, target_bytes=1000)
+    # 10 bytes per row -> 100 rows fit the target, growth is capped at 2x per chunk
+    sizer.observe(rows=10, payload_bytes=100, avro_time=0.001, post_time=0.001)
+    assert sizer.size == 20
+    sizer.observe(rows=20, payload_bytes=200, avro_time=0.001, post_time=0.001)
+    assert sizer.size == 40
+    for _ in range(5):
+        sizer.observe(rows=sizer.size, payload_bytes=sizer.size * 10, avro_time=0.001, post_time=0.001)
+    assert sizer.size == 100
+
+
+def test_chunk_sizer_shrinks_on_latency_within_bounds():
+    sizer = AdaptiveChunkSizer(initial_size=100, min_size=5, target_bytes=None, target_milliseconds=100)
+    # 10ms per row -> 10 rows per 100ms
+    sizer.observe(rows=100, payload_bytes=1000, avro_time=0.5, post_time=0.5)
+    assert sizer.size == 10
+    # 1s per row is bounded by min_size
+    sizer.observe(rows=10, payload_bytes=100, avro_time=5, post_time=5)
+    assert sizer.size == 5
+
+    with pytest.raises(ValueError):
+        AdaptiveChunkSizer(initial_size=10, min_size=10, max_size=5)
+
+
+def test_chunk_sizer_iter_chunks():
+    sizer = AdaptiveChunkSizer(initial_size=2, target_bytes=40)
+    df = pd.DataFrame({"a": range(11)})
+    sizes = []
+    for chunk in sizer.iter_chunks(df):
+        sizes.append(len(chunk))
+        sizer.observe(rows=len(chunk), payload_bytes=len(chunk) * 10, avro_time=0, post_time=0)
+    assert sizes == [2, 4, 4, 1]
@@ -1,4 +1,16 @@
+import copy
+import datetime
+import json
+import os
+import shutil
+from pathlib import Path
+from typing import Callable
+from unittest import mock
+
 import pandas as pd
+import pytest
+import yaml
+from intake.catalog.exceptions import ValidationError
 
 from intake_dal.dal_catalog import DalCatalog
 
@@ -69,3 +81,126 @@ def test_construct_dataset(cat):
     validate_dataset(cat["entity.user.user_events"])
     validate_dataset(cat.entity["user.user_events"])
     validate_dataset(cat.entity.user["user_events"])
+
+
+def test_parse_cache(catalog_path, tmp_path):
+    cache_dir = tmp_path / "parsed"
+    cat = DalCatalog(catalog_path, storage_mode="batch", parse_cache_dir=str(cache_dir))
+    assert cat.entity.user.user_events().read().shape[0] == 1
+    assert len(list(cache_dir.glob("*.json"))) == 1
+
+    # an unchanged catalog is not parsed again
+    with mock.patch("intake_dal.dal_catalog.yaml_load", side_effect=AssertionError("parsed")):
+        cat = DalCatalog(catalog_path, storage_mode="batch", parse_cache_dir=str(cache_dir))
+        assert cat.entity.user.user_events().read().shape[0] == 1
+        assert cat.entity.user.user_events.describe()["args"]["default"] == "batch"
+
+    # the storage mode is part of the key
+    cat = DalCatalog(catalog_path, storage_mode="local", parse_cache_dir=str(cache_dir))
+    assert cat.entity.user.user_events().read().shape[0] == 2
+    assert len(list(cache_dir.glob("*.json"))) == 2
+
+
+def test_parse_cache_data_only(catalog_path, tmp_path):
+    cache_dir = tmp_path / "parsed"
+    text = Path(catalog_path).read_text()
+    (tmp_path / "catalog.yaml").write_text(text)
+    (tmp_path / "dated.yaml").write_text(text.replace("metadata:\n", "metadata:\n  released: 2019-08-12\n", 1))
+
+    DalCatalog(str(tmp_path / "catalog.yaml"), parse_cache_dir=str(cache_dir))
+    (cache_path,) = cache_dir.glob("*.json")
+    assert json.loads(cache_path.read_text())["entity"]["user"]["user_events"]["args"]["default"] == "local"
+
+    # a corrupt entry is parsed again
+    cache_path.write_text("{")
+    assert DalCatalog(str(tmp_path / "catalog.yaml"), parse_cache_dir=str(cache_dir)).entity.user.user_events
+
+    # YAML dates don't round trip through JSON, they aren't cached
+    cat = DalCatalog(str(tmp_path / "dated.yaml"), parse_cache_dir=str(cache_dir))
+    assert cat.metadata["released"] == datetime.date(2019, 8, 12)
+    assert len(list(cache_dir.glob("*.json"))) == 1
+
+
+def test_parse_without_yaml_round_trip(catalog_path):
+    with mock.patch("intake_dal.dal_catalog.yaml.dump", side_effect=AssertionError("dumped")):
+        cat = DalCatalog(catalog_path, storage_mode="batch")
+    assert cat.entity.user.user_events().read().shape[0] == 1
+
+
+def _rewrite_catalog(path: Path, update: Callable[[dict], None]):
+    data = yaml.safe_load(path.read_text())
+    update(data)
+    mtime_ns = path.stat().st_mtime_ns
+    path.write_text(yaml.dump(data, default_flow_style=False))
+    # make sure the change is detected on file systems with a coarse mtime
+    os.utime(str(path), ns=(mtime_ns + 10 ** 9, mtime_ns + 10 ** 9))
+
+
+def test_autoreload_change_detection(catalog_path, tmp_path):
+    path = tmp_path / "catalog.yaml"
+    shutil.copy(catalog_path, str(path))
+    shutil.copytree(str(Path(catalog_path).parent / "data"), str(tmp_path / "data"))
+    cat = DalCatalog(str(path))
+    user = cat.entity._entries["user"]
+
+    # unchanged file: neither read nor parsed
+    with mock.patch("intake_dal.dal_catalog.yaml_load") as yaml_load, mock.patch.object(
+        DalCatalog, "parse", autospec=True, side_effect=DalCatalog.parse
+    ) as parse:
+        cat.force_reload()
+        assert parse.call_count == 0
+
+        # touched file: read but not parsed
+        os.utime(str(path), ns=(path.stat().st_mtime_ns + 10 ** 9,) * 2)
+        cat.force_reload()
+        assert parse.call_count == 1
+        assert yaml_load.call_count == 0
+
+    # a new subtree only builds that subtree
+    def add_home(data):
+        data["entity"]["home"] = {"home_events": copy.deepcopy(data["entity"]["user"]["user_events"])}
+
+    _rewrite_catalog(path, add_home)
+    cat.force_reload()
+    assert cat.entity._entries["user"] is user
+    assert cat.entity.home.home_events().read().shape[0] == 2
+    assert cat.entity.user.user_events().read().shape[0] == 2
+
+    # a changed source rebuilds its level
+    _rewrite_catalog(path, lambda data: data["entity"]["user"]["user_events"]["args"].update({"default": "batch"}))
+    cat.force_reload()
+    assert cat.entity._entries["user"] is not user
+    assert cat.entity.user.user_events().read().shape[0] == 1
+    assert cat.entity.home.home_events().read().shape[0] == 2
+
+
+def test_lazy_entries_and_canonical_name_index(catalog_path):
+    cat = DalCatalog(catalog_path)
+    assert cat._entries.built_entries() == {}
+    assert list(cat) == ["entity", "dataset_without_avro"]
+
+    entry = cat["entity.user.user_events"]
+    assert list(cat._entries.built_entries()) == ["entity"]
+    assert entry.name == "user_events"
+
+    with mock.patch.object(DalCatalog, "_construct_dataset", side_effect=AssertionError("constructed")):
+        assert cat["entity.user.user_events"] is entry
+        with pytest.raises(KeyError):
+            cat["entity.user.missing"]
+    assert "home" not in cat.entity
+
+
+def test_lazy_source_validation_errors(tmp_path):
+    path = tmp_path / "catalog.yaml"
+    path.write_text(
+        yaml.dump(
+            {
+                "metadata": {"hierarchical_catalog": True},
+                "entity": {"valid": {"driver": "csv", "args": {}}, "invalid": {"driver": "csv", "args": "a"}},
+            }
+        )
+    )
+    cat = DalCatalog(str(path))
+    assert cat["entity.valid"].name == "valid"
+    with pytest.raises(ValidationError):
+        cat["entity.invalid"]
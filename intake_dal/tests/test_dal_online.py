@@ -1,9 +1,17 @@
+import asyncio
 import datetime
+import io
 import json
+import threading
+import time
+import tracemalloc
 from typing import Dict, List
 from unittest import mock
 from unittest.mock import MagicMock
 
+import dask.dataframe as dd
+import fastavro
+import numpy as np
 import pandas as pd
 import pytest
 from pandas.util.testing import assert_frame_equal
@@ -11,7 +19,17 @@ from pandas.util.testing import assert_frame_equal
 from intake_dal.dal_catalog import DalCatalog
 from intake_dal.dal_online import (
     DalOnlineSource,
+    HttpSettings,
+    _apply_dtypes,
+    _configure_http_session,
+    _http_get_avro_data_set,
+    _http_put_avro_data_set,
+    _post_chunks_concurrently,
+    _post_in_chunks,
+    _put_chunks_async,
+    close_aiohttp_sessions,
     deserialize_avro_str_to_pandas,
+    serialize_panda_df_to_bytes,
     serialize_panda_df_to_str,
 )
 
@@ -164,6 +182,153 @@ def test_post_in_chunks(mock_put: MagicMock, serving_cat: DalCatalog, user_event
     assert len(ret) == 2
 
 
+def test_post_in_chunks_parallel(serving_cat: DalCatalog):
+    schema = json.loads(serving_cat.metadata["data_schema"]["entity.user.user_events"])
+    df = pd.DataFrame(
+        {
+            "userid": range(8),
+            "home_id": range(8),
+            "action": ["click"] * 8,
+            "timestamp": [datetime.datetime(2012, 5, 1, 0, 0)] * 8,
+        }
+    )
+    lock = threading.Lock()
+    in_flight = []
+    max_in_flight = []
+    posted = []
+
+    def post_lambda(avro_str: str) -> int:
+        with lock:
+            in_flight.append(1)
+            max_in_flight.append(len(in_flight))
+        time.sleep(0.05)
+        with lock:
+            in_flight.pop()
+            posted.append(deserialize_avro_str_to_pandas(avro_str))
+        return 200
+
+    ret = _post_in_chunks(df, schema, post_lambda, 2, write_parallelism=2)
+
+    assert len(ret) == 4
+    assert max(max_in_flight) == 2
+    assert sorted(pd.concat(posted).userid.tolist()) == list(range(8))
+
+
+def test_post_chunks_concurrently_failure():
+    posted = []
+
+    def post(chunk: int):
+        time.sleep(0.01)
+        if chunk == 5:
+            raise IOError("post failed")
+        posted.append(chunk)
+        return chunk, chunk
+
+    assert _post_chunks_concurrently(range(5), post, 2) == [(i, i) for i in range(5)]
+
+    posted.clear()
+    with pytest.raises(IOError, match="post failed"):
+        _post_chunks_concurrently(range(100), post, 2)
+    # the failure stops the submission of further chunks
+    assert max(posted) < 10
+
+
+def test_put_chunks_async_in_flight_and_failure():
+    in_flight = []
+    max_in_flight = []
+    posted = []
+
+    async def post(chunk: int):
+        in_flight.append(chunk)
+        max_in_flight.append(len(in_flight))
+        await asyncio.sleep(0.01 * (chunk % 3))
+        in_flight.remove(chunk)
+        if chunk == 5:
+            raise IOError("put failed")
+        posted.append(chunk)
+        return chunk, chunk
+
+    loop = asyncio.new_event_loop()
+    try:
+        # results come back in chunk order although the puts finish out of order
+        assert loop.run_until_complete(_put_chunks_async(range(5), post, 2)) == [(i, i) for i in range(5)]
+        assert max(max_in_flight) == 2
+
+        posted.clear()
+        with pytest.raises(IOError, match="put failed"):
+            loop.run_until_complete(_put_chunks_async(range(100), post, 2))
+        # the failure stops the submission of further chunks
+        assert max(posted) < 10
+    finally:
+        loop.close()
+
+
+@pytest.mark.parametrize("write_parallelism", [1, 4])
+def test_post_in_chunks_peak_memory(write_parallelism: int):
+    df = pd.DataFrame({"a": np.arange(1000000), "b": np.random.rand(1000000)})  # 16MB
+    df_bytes = df.memory_usage(index=False).sum()
+    posted = []
+
+    def serialize(chunk: pd.DataFrame, schema: Dict) -> bytes:
+        return b""
+
+    def post_lambda(payload: bytes) -> int:
+        posted.append(payload)
+        return 200
+
+    tracemalloc.start()
+    try:
+        _post_in_chunks(df, {}, post_lambda, 10000, write_parallelism=write_parallelism, serialize=serialize)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    assert len(posted) == 100
+    # chunks are views of df, far from a copy of df
+    assert peak < df_bytes / 10
+
+
+@mock.patch("intake_dal.dal_online._http_put_avro_data_set")
+def test_dal_online_write_chunked(mock_put: MagicMock, cat: DalCatalog):
+    mock_put.return_value = 200
+
+    # batch -> serving sync
+    ret = cat.entity.user.user_events(storage_mode="serving").write_chunked(
+        cat.entity.user.user_events(storage_mode="local").read_chunked()
+    )
+
+    assert len(ret) == 1
+    written = deserialize_avro_str_to_pandas(mock_put.call_args[0][1]["avro_rows"])
+    assert written.userid.tolist() == [42, 39]
+
+
+@mock.patch("intake_dal.dal_online._http_put_avro_data_set")
+def test_dal_online_write_dask(mock_put: MagicMock, serving_cat: DalCatalog, user_events_df: pd.DataFrame):
+    mock_put.return_value = 200
+    df = pd.concat([user_events_df] * 12, ignore_index=True)
+
+    # write_chunk_size is 10 and write_parallelism is 2 in the catalog
+    ret = serving_cat.entity.user.user_events().write_dask(dd.from_pandas(df, npartitions=3))
+
+    assert len(ret) == 3
+    written = pd.concat(deserialize_avro_str_to_pandas(c[0][1]["avro_rows"]) for c in mock_put.call_args_list)
+    assert sorted(written.userid.tolist()) == sorted(df.userid.tolist())
+
+
+@mock.patch("intake_dal.dal_online._http_put_avro_data_set")
+def test_post_in_chunks_adaptive(mock_put: MagicMock, serving_cat: DalCatalog, user_events_df: pd.DataFrame):
+    mock_put.return_value = 200
+
+    ds: DalOnlineSource = serving_cat["entity.user.user_events"]
+    ds.metadata[DalOnlineSource.name]["write_adaptive_chunk_size"] = True
+    ds.metadata[DalOnlineSource.name]["write_chunk_size"] = 1
+    ds.metadata[DalOnlineSource.name]["write_max_chunk_size"] = 1
+    ret = ds.write(pd.concat([user_events_df] * 3))
+
+    assert len(mock_put.call_args_list) == 6
+    assert len(ret) == 6
+
+
 @mock.patch("intake_dal.dal_online._http_get_avro_data_set")
 def test_dal_online_multi_key_read(
         mock_get: MagicMock,
@@ -193,6 +358,76 @@ def test_dal_online_multi_key_read_with_missing_entries(
     assert (mock_get.call_args_list[0] == [('https://featurestore.url.net', 'entity.user.user_events', '1,2,3')])
 
 
+@mock.patch("intake_dal.dal_online._http_get_avro_data_set")
+def test_dal_online_read_dtypes(
+    mock_get: MagicMock,
+    serving_cat: DalCatalog,
+    user_events_multi_key_with_some_missing_entries_json: List[Dict],
+):
+    mock_get.return_value = user_events_multi_key_with_some_missing_entries_json
+    df = serving_cat.entity.user.user_events(key=[1, 2, 3]).read()
+    assert str(df.timestamp.dtype) == "datetime64[ns]"
+    assert pd.isnull(df.timestamp[1])
+    # missing entries keep the columns nullable
+    assert str(df.home_id.dtype) == "float64"
+
+    mock_get.return_value = [row for row in user_events_multi_key_with_some_missing_entries_json if row]
+    df = serving_cat.entity.user.user_events(key=[1, 3]).read()
+    assert df.dtypes.astype(str).to_dict() == {
+        "userid": "int64",
+        "home_id": "int32",
+        "action": "object",
+        "timestamp": "datetime64[ns]",
+    }
+
+
+@mock.patch("intake_dal.dal_online._http_get_avro_data_set")
+def test_dal_online_multi_key_batched_read(mock_get: MagicMock, serving_cat: DalCatalog):
+    def get(url, canonical_name, key_value):
+        # userid 5 is missing
+        return [{"userid": int(k)} if k != "5" else {} for k in key_value.split(",")]
+
+    mock_get.side_effect = get
+    ds: DalOnlineSource = serving_cat.entity.user.user_events(key=list(range(10)))
+    ds.metadata[DalOnlineSource.name]["read_batch_size"] = 3
+    df = ds.read()
+
+    assert sorted(c[0][2] for c in mock_get.call_args_list) == ["0,1,2", "3,4,5", "6,7,8", "9"]
+    assert len(df) == 10
+    assert df.userid.tolist()[:5] == [0, 1, 2, 3, 4]
+    assert pd.isnull(df.userid[5])
+    assert df.userid.tolist()[6:] == [6, 7, 8, 9]
+
+
+@mock.patch("intake_dal.dal_online._http_put_avro_data_set")
+@mock.patch("intake_dal.dal_online._http_get_avro_data_set")
+def test_dal_online_cache(mock_get: MagicMock, mock_put: MagicMock, serving_cat: DalCatalog, monkeypatch):
+    monkeypatch.setattr("intake_dal.dal_online._caches", {})
+    mock_get.side_effect = lambda url, canonical_name, key_value: [
+        {"userid": int(k), "home_id": 1} for k in str(key_value).split(",")
+    ]
+    mock_put.return_value = 200
+
+    def user_events(**kwargs):
+        ds = serving_cat.entity.user.user_events(**kwargs)
+        ds.metadata[DalOnlineSource.name]["cache_ttl_seconds"] = 60
+        return ds
+
+    def read(key):
+        return user_events(key=key).read()
+
+    assert read([1, 2]).userid.tolist() == [1, 2]
+    assert read([2, 3, 1]).userid.tolist() == [2, 3, 1]
+    assert read(3).userid.tolist() == [3]
+    assert [c[0][2] for c in mock_get.call_args_list] == ["1,2", "3"]
+
+    ds = user_events()
+    ds.write(pd.DataFrame({"userid": [2], "home_id": [5], "action": ["click"], "timestamp": [None]}))
+    assert read([1, 2]).userid.tolist() == [1, 2]
+    assert mock_get.call_args_list[-1][0][2] == "2"
+    assert ds.source.cache_info() == {"hits": 4, "misses": 4, "evictions": 0, "entries": 3, "bytes": 0}
+
+
 @mock.patch("intake_dal.dal_online._http_get_avro_data_set")
 def test_dal_online_key_as_string(
         mock_get: MagicMock,
@@ -207,3 +442,204 @@ def test_dal_online_key_as_string(
     mock_get.assert_called()
     assert len(mock_get.call_args_list) == 1
     assert(mock_get.call_args_list[0] == [('https://featurestore.url.net', 'entity.user.user_events', '123')])
+
+
+def test_dal_online_read_write_async(http_server, serving_cat: DalCatalog, user_events_df: pd.DataFrame):
+    metadata = serving_cat.entity.user.user_events(storage_mode="serving").discover()["metadata"]
+    metadata[DalOnlineSource.name].update({"write_delay_between_chunks_milliseconds": 0, "write_chunk_size": 1})
+    row = {"userid": 1, "home_id": 3, "action": "click", "timestamp": None}
+
+    def respond(request):
+        if request["method"] == "PUT":
+            return 200, "application/json", b"{}"
+        time.sleep(0.2)
+        return 200, "application/json", json.dumps({"data": [row]}).encode()
+
+    http_server.respond = respond
+
+    async def fan_out():
+        return await asyncio.gather(
+            *[DalOnlineSource(f"{http_server.url}#userid", key=i, metadata=metadata).read_async() for i in range(10)]
+        )
+
+    loop = asyncio.new_event_loop()
+    try:
+        begin = time.time()
+        dfs = loop.run_until_complete(fan_out())
+        assert time.time() - begin < 1  # 10 lookups of 200ms each ran concurrently on the event loop
+        assert all(df.userid.tolist() == [1] for df in dfs)
+
+        ds = DalOnlineSource(f"{http_server.url}#userid", metadata=metadata)
+        assert len(loop.run_until_complete(ds.write_async(user_events_df))) == 2  # write_chunk_size is 1
+        puts = [r for r in http_server.requests if r["method"] == "PUT"]
+        assert [json.loads(r["body"])["key_value"] for r in puts] == ["userid", "userid"]
+        rows = [deserialize_avro_str_to_pandas(json.loads(r["body"])["avro_rows"]) for r in puts]
+        assert sorted(df.userid[0] for df in rows) == [100, 101]
+    finally:
+        loop.run_until_complete(close_aiohttp_sessions())
+        loop.close()
+
+
+def test_dal_online_async_avro_wire_format_and_retries(
+    http_server, serving_cat: DalCatalog, user_events_df: pd.DataFrame
+):
+    metadata = serving_cat.entity.user.user_events(storage_mode="serving").discover()["metadata"]
+    metadata[DalOnlineSource.name].update(
+        {"wire_format": DalOnlineSource.WIRE_FORMAT_AVRO, "http_retries": 2, "http_backoff_factor": 0}
+    )
+    avro_bytes = serialize_panda_df_to_bytes(user_events_df, metadata["avro_schema"])
+    responses = [(503, "text/plain", b"unavailable"), (200, "application/avro", avro_bytes)]
+    http_server.respond = lambda request: responses.pop(0)
+
+    loop = asyncio.new_event_loop()
+    try:
+        ds = DalOnlineSource(f"{http_server.url}#userid", key=[100, 101], metadata=metadata)
+        df = loop.run_until_complete(ds.read_async())
+        assert_frame_equal(user_events_df, df, check_dtype=False)
+        assert [r["path"] for r in http_server.requests] == ["/avro-data-sets/entity.user.user_events/100,101"] * 2
+        assert http_server.requests[1]["headers"]["Accept"] == "application/avro"
+
+        responses.extend([(503, "text/plain", b"unavailable")] * 3)
+        with pytest.raises(Exception, match="code=503"):
+            loop.run_until_complete(ds.read_async())
+    finally:
+        loop.run_until_complete(close_aiohttp_sessions())
+        loop.close()
+
+
+def test_dal_source_async_fallbacks(cat: DalCatalog):
+    loop = asyncio.new_event_loop()
+    try:
+        # sources without a native read_async or write_async run in an executor
+        csv_df = loop.run_until_complete(cat.entity.user.user_events(storage_mode="local").read_async())
+        assert len(csv_df) == 2
+
+        ds = cat.entity.user.user_events(storage_mode="in_mem", key="fifth")
+        assert loop.run_until_complete(ds.write_async(pd.DataFrame({"key": ["fifth"], "value": [5]}))) == 1
+        assert loop.run_until_complete(ds.read_async()).value.tolist() == [5]
+    finally:
+        loop.close()
+
+
+def test_dal_online_avro_wire_format(http_server, serving_cat: DalCatalog, user_events_df: pd.DataFrame):
+    metadata = serving_cat.entity.user.user_events(storage_mode="serving").discover()["metadata"]
+    metadata[DalOnlineSource.name]["wire_format"] = DalOnlineSource.WIRE_FORMAT_AVRO
+    avro_bytes = serialize_panda_df_to_bytes(user_events_df, metadata["avro_schema"])
+    http_server.respond = lambda request: (200, "application/avro", avro_bytes)
+
+    ds = DalOnlineSource(f"{http_server.url}#userid", key=[100, 101], metadata=metadata)
+    ds.write(user_events_df)
+    df = ds.read()
+
+    put, get = http_server.requests
+    assert put["method"] == "PUT"
+    assert put["path"] == "/avro-data-sets/entity.user.user_events?key_value=userid"
+    assert put["headers"]["Content-Type"] == "application/avro"
+    assert list(fastavro.reader(io.BytesIO(put["body"])))[0]["userid"] == 100
+    assert get["path"] == "/avro-data-sets/entity.user.user_events/100,101"
+    assert get["headers"]["Accept"] == "application/avro"
+    assert_frame_equal(user_events_df, df, check_dtype=False)
+    assert str(df.timestamp.dtype) == "datetime64[ns]"
+
+
+@mock.patch("intake_dal.dal_online._http_get_avro_binary_data_set")
+def test_dal_online_avro_wire_format_missing_keys(mock_get: MagicMock, serving_cat: DalCatalog, monkeypatch):
+    monkeypatch.setattr("intake_dal.dal_online._caches", {})
+    metadata = serving_cat.entity.user.user_events(storage_mode="serving").discover()["metadata"]
+    metadata[DalOnlineSource.name]["wire_format"] = DalOnlineSource.WIRE_FORMAT_AVRO
+    cached_metadata = {**metadata, DalOnlineSource.name: {**metadata[DalOnlineSource.name], "cache_ttl_seconds": 60}}
+    # the Avro container only has the rows of the found keys, in any order
+    mock_get.return_value = [{"userid": 101, "home_id": 4}, {"userid": 100, "home_id": 3}]
+
+    uncached = DalOnlineSource("https://featurestore.url.net#userid", key=[100, 7, 101], metadata=metadata).read()
+    assert uncached.userid.tolist()[::2] == [100, 101]
+    assert uncached.userid.isnull().tolist() == [False, True, False]
+    for _ in range(2):
+        cached = DalOnlineSource("https://featurestore.url.net#userid", key=[100, 7, 101], metadata=cached_metadata)
+        assert_frame_equal(uncached, cached.read())
+    assert mock_get.call_count == 2
+
+
+def test_http_session_retries_with_keep_alive(http_server):
+    _configure_http_session(http_server.url, HttpSettings(retries=2, backoff_factor=0))
+    responses = [
+        (503, "text/plain", b"unavailable"),
+        (200, "application/json", b'{"data": [{"userid": 1}]}'),
+        (200, "application/json", b'{"data": [{"userid": 2}]}'),
+        (200, "application/json", b"{}"),
+    ]
+    http_server.respond = lambda request: responses.pop(0)
+
+    assert _http_get_avro_data_set(http_server.url, "entity.user.user_events", "1") == [{"userid": 1}]
+    assert _http_get_avro_data_set(http_server.url, "entity.user.user_events", "2") == [{"userid": 2}]
+    assert _http_put_avro_data_set(http_server.url, {"avro_rows": "abc"}) == 200
+
+    assert [r["method"] for r in http_server.requests] == ["GET", "GET", "GET", "PUT"]
+    assert http_server.requests[0]["path"] == "/avro-data-sets/entity.user.user_events/1"
+    assert json.loads(http_server.requests[3]["body"]) == {"avro_rows": "abc"}
+    # all the requests went through a single pooled keep-alive connection
+    assert len({r["client_address"] for r in http_server.requests}) == 1
+
+
+def test_http_session_gives_up_after_retries(http_server):
+    _configure_http_session(http_server.url, HttpSettings(retries=1, backoff_factor=0))
+    http_server.respond = lambda request: (500, "text/plain", b"boom")
+
+    with pytest.raises(Exception, match="code=500"):
+        _http_get_avro_data_set(http_server.url, "entity.user.user_events", "1")
+    assert len(http_server.requests) == 2
+
+
+def test_apply_dtypes_keeps_values_out_of_range():
+    df = pd.DataFrame({"big": [3000000000, 1], "small": [3, 4], "flag": ["no", "yes"]})
+    df = _apply_dtypes(df, {"big": "int32", "small": "int32", "flag": "bool"}, DalOnlineSource.DATE_TIME_FORMAT)
+
+    assert df.big.tolist() == [3000000000, 1]
+    assert df.big.dtype == "int64"
+    assert df.small.dtype == "int32"
+    assert df.flag.tolist() == ["no", "yes"]
+
+
+@mock.patch("intake_dal.dal_online._http_get_avro_data_set")
+def test_dal_online_cache_rows_per_key(mock_get: MagicMock, serving_cat: DalCatalog, monkeypatch):
+    monkeypatch.setattr("intake_dal.dal_online._caches", {})
+    server = {
+        "1": [],
+        "2": [{"userid": 2, "home_id": 1}, {"userid": 2, "home_id": 2}],
+        "3": [{"userid": 3, "home_id": 3}],
+    }
+
+    def get(url, canonical_name, key_value):
+        keys = str(key_value).split(",")
+        if len(keys) == 1:
+            return server[keys[0]]
+        # json wire format batches answer an empty row for a missing key
+        return [row for k in keys for row in server[k] or [{}]]
+
+    mock_get.side_effect = get
+
+    def read(key):
+        ds = serving_cat.entity.user.user_events(key=key)
+        ds.metadata[DalOnlineSource.name]["cache_ttl_seconds"] = 60
+        return ds.read()
+
+    for _ in range(2):  # fetched, then cached
+        assert len(read(1)) == 0
+        assert read(2).home_id.tolist() == [1, 2]
+        df = read([3, 1, 2])
+        assert df.home_id.tolist()[:1] + df.home_id.tolist()[2:] == [3, 1, 2]
+        assert pd.isnull(df.userid[1])
+    assert [str(c[0][2]) for c in mock_get.call_args_list] == ["1", "2", "3"]
+
+
+@mock.patch("intake_dal.dal_online._http_get_avro_data_set")
+def test_dal_online_cache_unmatched_rows(mock_get: MagicMock, serving_cat: DalCatalog, monkeypatch):
+    monkeypatch.setattr("intake_dal.dal_online._caches", {})
+    # rows without their key can't be cached by key
+    mock_get.return_value = [{"home_id": 1}]
+
+    ds = serving_cat.entity.user.user_events(key=[1, 2])
+    ds.metadata[DalOnlineSource.name]["cache_ttl_seconds"] = 60
+    assert ds.read().home_id.tolist() == [1]
+    ds._get_source()
+    assert ds.source.cache_info()["entries"] == 0
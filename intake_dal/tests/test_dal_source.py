@@ -1,6 +1,25 @@
+import shutil
+from pathlib import Path
+from unittest import mock
 from urllib.parse import urlparse
 
-from intake_dal.dal_source import DalSource
+import numpy as np
+import pandas as pd
+import pytest
+import yaml
+from intake.catalog.local import LocalCatalogEntry
+from pandas.util.testing import assert_frame_equal
+
+from intake_dal import dal_source
+from intake_dal.dal_catalog import DalCatalog
+from intake_dal.dal_source import (
+    DalSource,
+    SchemaRegistry,
+    WriteError,
+    _avro_to_dtype,
+    _enforce_dtypes,
+)
+from intake_dal.in_memory_kv import InMemoryKVSource
 
 
 def test_dal_source_description(cat):
@@ -64,3 +83,421 @@ def test_parse_storage_mode_url():
         "hive://user_events_dal_catalog2;userid={{userid}}?q1=v1#fragment",
         "user_events_dal_catalog2;userid={{userid}}?q1=v1#fragment",
     )
+
+
+def test_schema_registry_memoizes_schemas(cat):
+    with mock.patch("intake_dal.dal_source._avro_to_dtype", wraps=_avro_to_dtype) as avro_to_dtype:
+        first = cat.entity.user.user_events(storage_mode="local").discover()
+        second = cat.entity.user.user_events(storage_mode="batch").discover()
+        assert avro_to_dtype.call_count == 1
+    assert first["dtype"] == second["dtype"]
+    assert cat.entity.user.user_events(storage_mode="batch").avro_schema["name"] == "Root"
+
+
+def test_schema_registry_invalidated_on_reload(catalog_path, tmp_path):
+    path = tmp_path / "catalog.yaml"
+    shutil.copy(catalog_path, str(path))
+    cat = DalCatalog(str(path))
+    assert cat.entity.user.user_events(storage_mode="serving").discover()["dtype"]["home_id"] == "int32"
+
+    path.write_text(path.read_text().replace('"name": "home_id", "type": "int"', '"name": "home_id", "type": "long"'))
+    cat.force_reload()
+    assert cat.entity.user.user_events(storage_mode="serving").discover()["dtype"]["home_id"] == "int64"
+
+
+def test_schema_registry():
+    registry = SchemaRegistry()
+    avro_json = '{"fields": [{"name": "userid", "type": "long"}], "name": "Root", "type": "record"}'
+    resolve = mock.Mock(return_value=avro_json)
+
+    first = registry.get("a.b", resolve)
+    assert first.dtypes == {"userid": "int64"}
+    assert registry.get("a.b", resolve) is first
+    assert registry.get("a.c", lambda: avro_json) is first
+    assert resolve.call_count == 1
+    assert registry.get("a.d", lambda: None) is None
+
+    registry.invalidate()
+    assert registry.get("a.b", resolve) is not first
+    assert resolve.call_count == 2
+
+    # expired schemas are resolved again
+    assert registry.get("a.e", resolve, ttl_seconds=0) is not None
+    registry.get("a.e", resolve, ttl_seconds=60)
+    registry.get("a.e", resolve, ttl_seconds=60)
+    assert resolve.call_count == 4
+
+
+@pytest.mark.parametrize("storage_mode", ["local", "batch"])
+def test_enforce_dtypes(cat, storage_mode):
+    df = cat.entity.user.user_events(storage_mode=storage_mode).read()
+    assert str(df.home_id.dtype) == "int64"
+
+    ds = cat.entity.user.user_events(storage_mode=storage_mode, enforce_dtypes=True)
+    df = ds.read()
+    assert df.dtypes.astype(str)[["userid", "home_id", "action"]].to_dict() == {
+        "userid": "int64",
+        "home_id": "int32",
+        "action": "object",
+    }
+    assert [str(chunk.home_id.dtype) for chunk in ds.read_chunked()] == ["int32"]
+    assert str(ds.to_dask().home_id.dtype) == "int32"
+    assert str(ds.to_dask().compute().home_id.dtype) == "int32"
+
+    ds = cat.entity.user.user_events(storage_mode=storage_mode, enforce_dtypes=True, category_threshold=1.0)
+    assert str(ds.read().action.dtype) == "category"
+
+
+def test_enforce_dtypes_csv_casts_after_read(cat):
+    ds = cat.entity.user.user_events(storage_mode="local", enforce_dtypes=True)
+    assert ds.read().home_id.dtype == np.int32
+    # read_csv would wrap out of range integers, only float dtypes are given to it
+    assert ds.source._csv_kwargs["dtype"] == {}
+
+
+def test_enforce_dtypes_csv_out_of_range_and_blank(catalog_path, tmp_path):
+    data = yaml.safe_load(Path(catalog_path).read_text())
+    data["entity"]["user"]["user_events"]["args"]["storage"]["local"] = "csv://{{ CATALOG_DIR }}/user_events.csv"
+    (tmp_path / "catalog.yaml").write_text(yaml.dump(data))
+    (tmp_path / "user_events.csv").write_text(
+        "userid,home_id,action,timestamp\n1,3000000000,view,2019-08-12\n,4,view,2019-08-12\n"
+    )
+    df = DalCatalog(str(tmp_path / "catalog.yaml")).entity.user.user_events(enforce_dtypes=True).read()
+    assert df.home_id.tolist() == [3000000000, 4]
+    assert df.userid[0] == 1 and np.isnan(df.userid[1])
+
+
+def test_enforce_dtypes_function():
+    df = pd.DataFrame(
+        {
+            "count": [1.0, None, 3.0],
+            "flag": [1, 0, 1],
+            "ratio": [0.5, 0.25, 1.0],
+            "time": ["2019-08-12", "2019-08-13", None],
+            "city": ["a", "a", "b"],
+            "name": ["x", "y", "z"],
+        }
+    )
+    schema = {
+        "fields": [
+            {"name": "count", "type": ["null", "int"]},
+            {"name": "flag", "type": "boolean"},
+            {"name": "ratio", "type": "float"},
+            {"name": "time", "type": ["null", {"logicalType": "timestamp-millis", "type": "long"}]},
+            {"name": "city", "type": "string"},
+            {"name": "name", "type": "string"},
+        ]
+    }
+    dtypes = _enforce_dtypes(df, _avro_to_dtype(schema), category_threshold=0.7).dtypes.astype(str).to_dict()
+    assert dtypes == {
+        "count": "float64",
+        "flag": "bool",
+        "ratio": "float32",
+        "time": "datetime64[ns]",
+        "city": "category",
+        "name": "object",
+    }
+
+
+def test_enforce_dtypes_keeps_values():
+    df = pd.DataFrame({"home_id": [3000000000, 1], "flag": ["no", "yes"], "small": [1, 2]})
+    schema = {
+        "fields": [
+            {"name": "home_id", "type": "int"},
+            {"name": "flag", "type": "boolean"},
+            {"name": "small", "type": "int"},
+        ]
+    }
+    df = _enforce_dtypes(df, _avro_to_dtype(schema), category_threshold=None)
+    assert df.home_id.tolist() == [3000000000, 1]
+    assert df.flag.tolist() == ["no", "yes"]
+    assert df.small.dtype == "int32"
+
+
+def test_columns_pushdown(cat):
+    ds = cat.entity.user.user_events(storage_mode="local", columns=["action", "userid"])
+    assert list(ds.read().columns) == ["action", "userid"]
+    assert ds.source._csv_kwargs["usecols"] == ["action", "userid"]
+
+    ds = cat.entity.user.user_events(storage_mode="batch", columns=["userid"])
+    assert list(ds.read().columns) == ["userid"]
+    assert ds.source._kwargs["columns"] == ["userid"]
+    assert list(ds.to_dask().compute().columns) == ["userid"]
+
+
+def test_filters_pushdown(cat):
+    ds = cat.entity.user.user_events(storage_mode="local", columns=["userid"], filters=[("home_id", ">", 50)])
+    df = ds.read()
+    assert df.to_dict("list") == {"userid": [42]}
+    assert ds.source._csv_kwargs["usecols"] == ["userid", "home_id"]
+    assert ds.to_dask().compute().to_dict("list") == {"userid": [42]}
+    assert pd.concat(ds.read_chunked()).to_dict("list") == {"userid": [42]}
+
+    # OR-ed conjunctions, as lists like in YAML
+    filters = [[["userid", "==", 39]], [["home_id", "in", [101]], ["action", "!=", "home_buy"]]]
+    assert len(cat.entity.user.user_events(storage_mode="local", filters=filters).read()) == 2
+
+    ds = cat.entity.user.user_events(storage_mode="batch", filters=[("userid", "==", -1)])
+    assert len(ds.read()) == 0
+    assert ds.source._kwargs["filters"] == [[("userid", "==", -1)]]
+    assert "gather_statistics" not in ds.source._kwargs
+
+
+def test_read_options_validated_against_avro_schema(cat):
+    with pytest.raises(ValueError, match="not in the Avro schema"):
+        cat.entity.user.user_events(storage_mode="local", columns=["userid", "zipcode"]).read()
+    with pytest.raises(ValueError, match="not in the Avro schema"):
+        cat.entity.user.user_events(storage_mode="local", filters=[("zipcode", "==", 1)]).read()
+    with pytest.raises(ValueError, match="invalid filter"):
+        cat.entity.user.user_events(storage_mode="local", filters=[("userid", "~", 1)]).read()
+
+
+@pytest.fixture
+def partitioned_cat(catalog_path, tmp_path):
+    data = yaml.safe_load(Path(catalog_path).read_text())
+    data["entity"]["user"]["user_events"]["args"]["storage"].update(
+        {
+            "partitioned": "parquet://{{ CATALOG_DIR }}/partitioned",
+            "partitioned_csv": "csv://{{ CATALOG_DIR }}/partitioned_csv/*.csv",
+        }
+    )
+    (tmp_path / "catalog.yaml").write_text(yaml.dump(data))
+    (tmp_path / "partitioned").mkdir()
+    (tmp_path / "partitioned_csv").mkdir()
+    for i in range(3):
+        df = pd.DataFrame({"userid": [i * 10, i * 10 + 1], "home_id": [i, i], "action": ["home_view", "home_buy"]})
+        df.to_parquet(str(tmp_path / "partitioned" / f"part.{i}.parquet"))
+        df.to_csv(str(tmp_path / "partitioned_csv" / f"part.{i}.csv"), index=False)
+    return DalCatalog(str(tmp_path / "catalog.yaml"))
+
+
+@pytest.mark.parametrize("storage_mode", ["partitioned", "partitioned_csv"])
+def test_partitions(partitioned_cat, storage_mode):
+    ds = partitioned_cat.entity.user.user_events(storage_mode=storage_mode)
+    info = ds.discover()
+    assert info["npartitions"] == 3
+    assert ds.npartitions == 3
+    assert ds.shape == (None, 4)
+    assert ds.read_partition(2).userid.tolist() == [20, 21]
+
+    df = ds.read().reset_index(drop=True)
+    assert len(df) == 6
+    assert_frame_equal(ds.read_parallel(max_workers=3).reset_index(drop=True), df)
+    assert_frame_equal(ds.read_parallel(max_workers=2, processes=True).reset_index(drop=True), df)
+
+
+def test_read_parallel_read_options(partitioned_cat):
+    ds = partitioned_cat.entity.user.user_events(
+        storage_mode="partitioned", columns=["userid", "action"], filters=[("home_id", ">", 0)], enforce_dtypes=True,
+        category_threshold=0.5,
+    )
+    df = ds.read_parallel()
+    assert df.userid.tolist() == [10, 11, 20, 21]
+    assert list(df.columns) == ["userid", "action"]
+    assert str(df.action.dtype) == "category"
+
+
+@pytest.mark.parametrize("storage_mode", ["partitioned", "partitioned_csv"])
+def test_read_filters_by_partition(partitioned_cat, storage_mode):
+    ds = partitioned_cat.entity.user.user_events(
+        storage_mode=storage_mode, columns=["userid", "action"], filters=[("home_id", ">", 0)], enforce_dtypes=True,
+        category_threshold=0.5,
+    )
+    ds._load_metadata()
+    assert ds.dtype == {"userid": "int64", "action": "object"}
+    # the whole dataset is never loaded at once
+    with mock.patch.object(type(ds.source), "read", side_effect=AssertionError("read everything")):
+        df = ds.read()
+    assert df.userid.tolist() == [10, 11, 20, 21]
+    assert list(df.columns) == ["userid", "action"]
+    assert str(df.action.dtype) == "category"
+
+
+def test_read_parallel_single_partition(cat):
+    ds = cat.entity.user.user_events(storage_mode="local")
+    assert ds.npartitions == 0  # not discovered yet
+    assert_frame_equal(ds.read_parallel(), ds.read())
+    assert ds.npartitions == 1
+
+
+@pytest.fixture
+def empty_source_cache(monkeypatch):
+    """ No storage mode source nor in-memory-kvs table left by another test. """
+    dal_source._source_cache.clear()
+    monkeypatch.setattr(InMemoryKVSource, "tables", {})
+    yield
+    dal_source._source_cache.clear()
+
+
+def test_storage_mode_source_cache(cat, empty_source_cache):
+    with mock.patch("intake_dal.dal_source.LocalCatalogEntry", wraps=LocalCatalogEntry) as entry_mock:
+        second = cat.entity.user.user_events(storage_mode="in_mem", key="second")
+        third = cat.entity.user.user_events(storage_mode="in_mem", key="third")
+        everything = cat.entity.user.user_events(storage_mode="in_mem")
+        assert second.read().value.tolist() == [2]
+        assert third.read().value.tolist() == [3]
+        assert everything.read().value.tolist() == [1, 2, 3, 4]
+        assert entry_mock.call_count == 1
+
+    # a copy of the cached source per DalSource
+    assert second.source is not third.source
+    assert second.source.metadata is not third.source.metadata
+    assert second.source.metadata["canonical_name"] == "entity.user.user_events"
+
+
+def test_storage_mode_source_cache_keys(cat):
+    def source_args(**kwargs):
+        ds = cat.entity.user.user_events(**kwargs)
+        ds._get_source()
+        return ds.source._kwargs
+
+    assert "columns" not in source_args(storage_mode="batch")
+    assert source_args(storage_mode="batch", columns=["userid"])["columns"] == ["userid"]
+    assert "columns" not in source_args(storage_mode="batch")
+
+
+def test_storage_mode_source_cache_catalog_reload(tmp_path, catalog_path):
+    shutil.copy(catalog_path, tmp_path)
+    shutil.copytree(Path(catalog_path).parent / "data", tmp_path / "data")
+    cat = DalCatalog(str(tmp_path / "catalog.yaml"))
+    ds = cat.entity.user.user_events(storage_mode="serving", key=1)
+    ds._get_source()
+    assert ds.source._url == "https://featurestore.url.net"
+
+    text = (tmp_path / "catalog.yaml").read_text().replace("featurestore.url.net", "featurestore2.url.net")
+    (tmp_path / "catalog.yaml").write_text(text)
+    cat.force_reload()
+    ds = cat.entity.user.user_events(storage_mode="serving", key=2)
+    ds._get_source()
+    assert ds.source._url == "https://featurestore2.url.net"
+    assert ds.source._key_value == 2
+
+
+@mock.patch("intake_dal.dal_online.DalOnlineSource.write")
+@mock.patch("intake_dal.dal_online._http_get_avro_data_set", return_value=[{}])
+def test_storage_chain_fallback_on_miss_and_backfill(get_mock, write_mock, cat):
+    ds = cat.entity.user.user_events(storage_chain=["serving", "in_mem"], backfill=True, key="second")
+    df = ds.read()
+    assert df.value.tolist() == [2]
+    assert get_mock.call_count == 1
+    assert write_mock.call_count == 1
+    assert_frame_equal(write_mock.call_args[0][0], df)
+
+
+@mock.patch("intake_dal.dal_online.DalOnlineSource.write")
+@mock.patch("intake_dal.dal_online._http_get_avro_data_set", side_effect=IOError("unavailable"))
+def test_storage_chain_fallback_on_error(get_mock, write_mock, cat):
+    ds = cat.entity.user.user_events(storage_chain=["serving", "in_mem"], backfill=True, key="second")
+    assert ds.read().value.tolist() == [2]
+    # failed storage modes aren't backfilled
+    assert write_mock.call_count == 0
+
+    ds = cat.entity.user.user_events(storage_chain=["serving"], key="second")
+    with pytest.raises(IOError):
+        ds.read()
+
+
+@mock.patch("intake_dal.dal_online._http_get_avro_data_set")
+def test_storage_chain_first_hit(get_mock, cat):
+    ds = cat.entity.user.user_events(storage_chain=["in_mem", "serving"], key="second")
+    assert ds.read().value.tolist() == [2]
+    assert get_mock.call_count == 0
+
+    # an explicit storage mode reads that storage mode only
+    ds = cat.entity.user.user_events(storage_chain=["in_mem", "serving"], storage_mode="local")
+    assert len(ds.read()) == 2
+
+
+@mock.patch("intake_dal.dal_online.DalOnlineSource.write")
+@mock.patch("intake_dal.dal_online._http_get_avro_data_set", return_value=[{}])
+def test_storage_chain_key_of_batch_storage_modes(get_mock, write_mock, cat):
+    # parquet and csv don't take a key, they read the rows of the serving key column
+    for storage_mode in ["batch", "local"]:
+        ds = cat.entity.user.user_events(storage_chain=["serving", storage_mode], backfill=True, key=39)
+        df = ds.read()
+        assert df.userid.tolist() == ([] if storage_mode == "batch" else [39])
+    assert write_mock.call_count == 1
+    assert write_mock.call_args[0][0].userid.tolist() == [39]
+
+    ds = cat.entity.user.user_events(storage_chain=["serving", "local"], key=[42, 39], filters=[("home_id", ">", 50)])
+    assert ds.read().userid.tolist() == [42]
+
+
+@mock.patch("intake_dal.dal_online.DalOnlineSource.write")
+@mock.patch("intake_dal.dal_online._http_get_avro_data_set")
+def test_storage_chain_partial_multi_key_hit(get_mock, write_mock, cat):
+    get_mock.return_value = [{"userid": 39, "home_id": 7, "action": "home_buy", "timestamp": None}, {}]
+    ds = cat.entity.user.user_events(storage_chain=["serving", "local"], backfill=True, key=[42, 39])
+    df = ds.read()
+    # 39 from serving, 42 from local, in keys order
+    assert df.userid.tolist() == [42, 39]
+    assert df.home_id.tolist() == [101, 7]
+    assert get_mock.call_args[0][2] == "42,39"
+    # serving is only backfilled with the key it missed
+    assert write_mock.call_count == 1
+    assert write_mock.call_args[0][0].userid.tolist() == [42]
+
+    # only the missing keys are read from the next storage mode
+    get_mock.reset_mock()
+    get_mock.return_value = [{}]
+    ds = cat.entity.user.user_events(storage_chain=["in_mem", "serving"], key=["second", "missing"])
+    assert ds.read().value.tolist() == [2]
+    assert get_mock.call_args[0][2] == "missing"
+
+
+def test_storage_chain_validation(cat):
+    with pytest.raises(ValueError, match="not in"):
+        cat.entity.user.user_events(storage_chain=["in_mem", "nope"])
+    with pytest.raises(ValueError, match="partial rows"):
+        cat.entity.user.user_events(storage_chain=["in_mem", "local"], backfill=True, columns=["userid"])
+
+
+@mock.patch("intake_dal.dal_online._http_put_avro_data_set", return_value=200)
+def test_write_fan_out(put_mock, cat):
+    user_events_df = cat.entity.user.user_events(storage_mode="local").read()
+    # in_mem is keyed by a "key" column
+    with pytest.raises(WriteError) as e:
+        cat.entity.user.user_events().write(user_events_df, storage_modes=["serving", "in_mem", "serving"])
+    results = e.value.results
+    assert list(results) == ["serving", "in_mem"]
+    assert results["serving"].error is None
+    assert results["serving"].seconds > 0
+    assert put_mock.call_count == 1
+    assert isinstance(results["in_mem"].error, KeyError)
+
+    results = cat.entity.user.user_events().write(pd.DataFrame({"key": ["second"], "value": [2]}), ["in_mem"])
+    assert results["in_mem"].error is None
+    assert results["in_mem"].result == 1
+
+    with pytest.raises(ValueError, match="not in"):
+        cat.entity.user.user_events().write(user_events_df, storage_modes=["nope"])
+
+
+@mock.patch("intake_dal.dal_online._http_put_avro_data_set", return_value=200)
+def test_write_fan_out_serving_and_batch(put_mock, catalog_path, tmp_path):
+    shutil.copy(catalog_path, str(tmp_path))
+    shutil.copytree(str(Path(catalog_path).parent / "data"), str(tmp_path / "data"))
+    cat = DalCatalog(str(tmp_path / "catalog.yaml"))
+    df = cat.entity.user.user_events(storage_mode="local").read()
+
+    results = cat.entity.user.user_events().write(df, storage_modes=["serving", "batch", "local"])
+    assert put_mock.call_count == 1
+    assert results["batch"].result == results["local"].result == 2
+    # the batch files are overwritten
+    assert_frame_equal(cat.entity.user.user_events(storage_mode="batch").read(), df)
+    assert_frame_equal(cat.entity.user.user_events(storage_mode="local").read(), df)
+
+
+@mock.patch("intake_dal.dal_online._http_put_avro_data_set", return_value=200)
+def test_write_fan_out_checks_targets_first(put_mock, partitioned_cat):
+    df = partitioned_cat.entity.user.user_events(storage_mode="partitioned").read()
+    with pytest.raises(ValueError, match="partitioned"):
+        partitioned_cat.entity.user.user_events().write(df, storage_modes=["serving", "partitioned"])
+    assert put_mock.call_count == 0
+    with pytest.raises(ValueError, match="partitioned"):
+        partitioned_cat.entity.user.user_events(storage_mode="partitioned_csv").write(df)
+
+
+def test_nullable_long_dtype():
+    schema = {"type": "record", "name": "Root", "fields": [{"name": "a", "type": ["null", "long"]}]}
+    assert _avro_to_dtype(schema) == {"a": np.dtype("int64")}
@@ -0,0 +1,89 @@
+import datetime
+import uuid
+
+import numpy as np
+import pandas as pd
+import pytest
+import yaml
+from pandas.util.testing import assert_frame_equal
+
+from intake_dal.dal_catalog import DalCatalog
+from intake_dal.in_memory_kv import KVTable
+
+
+def test_kv_table_get_and_upsert():
+    table = KVTable("key")
+    assert table.upsert(pd.DataFrame({"key": ["a", "b", "c"], "value": [1, 2, 3]})) == 3
+    assert table.upsert(pd.DataFrame({"key": ["b", "d", "d"], "value": [20, 4, 40]})) == 2
+
+    assert len(table) == 4
+    assert table.get().to_dict("list") == {"key": ["a", "b", "c", "d"], "value": [1, 20, 3, 40]}
+    # keys order, missing keys skipped
+    assert table.get(["d", "missing", "a"]).to_dict("list") == {"key": ["d", "a"], "value": [40, 1]}
+    assert table.get([]).shape == (0, 2)
+    assert table.get().value.dtype == np.int64
+
+
+def test_kv_table_columns():
+    table = KVTable("key")
+    table.upsert(pd.DataFrame({"key": ["a", "b"], "value": [1, 2]}))
+    # a new column, rows without it are missing, other columns of existing keys are kept
+    table.upsert(pd.DataFrame({"key": ["b", "c"], "flag": [True, False]}))
+
+    df = table.get()
+    assert df.key.tolist() == ["a", "b", "c"]
+    assert df.value.tolist()[:2] == [1, 2] and np.isnan(df.value[2])
+    assert df.flag.tolist() == [None, True, False]
+
+
+def test_kv_table_growth():
+    table = KVTable("key")
+    for start in range(0, 1000, 100):
+        table.upsert(pd.DataFrame({"key": np.arange(start, start + 100), "value": np.arange(start, start + 100) * 2}))
+    assert len(table) == 1000
+    assert table.get([999, 0, 500]).value.tolist() == [1998, 0, 1000]
+
+
+def test_kv_table_schema_dtypes():
+    table = KVTable("userid", {"userid": "int64", "home_id": "int32", "timestamp": "datetime64"})
+    assert table.get().dtypes.astype(str).to_dict() == {
+        "userid": "int64",
+        "home_id": "int32",
+        "timestamp": "datetime64[ns]",
+    }
+
+    table.upsert(pd.DataFrame({"userid": [1], "home_id": [3], "timestamp": ["2012-05-01 00:00:00"]}))
+    assert table.get([1]).iloc[0].timestamp == pd.Timestamp(2012, 5, 1)
+    assert table.get().home_id.dtype == np.int32
+
+    with pytest.raises(ValueError, match="not in the table columns"):
+        table.upsert(pd.DataFrame({"userid": [1], "other": [3]}))
+    with pytest.raises(KeyError):
+        table.upsert(pd.DataFrame({"home_id": [3]}))
+
+
+@pytest.fixture
+def kv_cat(catalog_path, tmp_path):
+    """ A catalog with an in-memory-kvs table of its own keyed by userid. """
+    data = yaml.safe_load(open(catalog_path).read())
+    data["entity"]["user"]["user_events"]["args"]["storage"]["in_mem"] = f"in-memory-kvs://{uuid.uuid4()}#userid"
+    (tmp_path / "catalog.yaml").write_text(yaml.dump(data))
+    return DalCatalog(str(tmp_path / "catalog.yaml"), storage_mode="in_mem")
+
+
+def test_in_memory_kv_source_avro_schema(kv_cat):
+    df = pd.DataFrame(
+        {
+            "userid": [100, 101, 102],
+            "home_id": [3, 4, 5],
+            "action": ["click", "click", "view"],
+            "timestamp": [datetime.datetime(2012, 5, 1), datetime.datetime(2012, 5, 2), datetime.datetime(2012, 5, 3)],
+        }
+    )
+    assert kv_cat.entity.user.user_events().read().shape == (0, 4)
+    assert kv_cat.entity.user.user_events().write(df) == 3
+
+    assert kv_cat.entity.user.user_events().discover()["dtype"]["home_id"] == "int32"
+    assert kv_cat.entity.user.user_events(key=101).read().action.tolist() == ["click"]
+    expected = df.iloc[[2, 0]].reset_index(drop=True).astype({"home_id": "int32"})
+    assert_frame_equal(kv_cat.entity.user.user_events(key=[102, 100]).read(), expected)
@@ -0,0 +1,19 @@
+from pathlib import Path
+
+from intake_dal import json_cache
+
+
+def test_json_cache_round_trip(tmp_path: Path):
+    cache_path = tmp_path / "nested" / "entry.json"
+    assert json_cache.read_entry(cache_path) is None
+
+    json_cache.write_entry(cache_path, {"schema": "{}", "version": 3})
+    assert json_cache.read_entry(cache_path) == {"schema": "{}", "version": 3}
+    # the temporary file was moved in place
+    assert [p.name for p in cache_path.parent.iterdir()] == ["entry.json"]
+
+
+def test_json_cache_corrupt_entry(tmp_path: Path):
+    cache_path = tmp_path / "entry.json"
+    cache_path.write_text('{"schema": ')
+    assert json_cache.read_entry(cache_path) is None
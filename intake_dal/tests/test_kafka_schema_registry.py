@@ -0,0 +1,139 @@
+import json
+from pathlib import Path
+
+import pytest
+import yaml
+
+from intake_dal.dal_catalog import DalCatalog
+from intake_dal.dal_online import HttpSettings, _configure_http_session
+from intake_dal.kafka_schema_registry import (
+    KafkaSchemaRegistry,
+    SchemaRegistryError,
+)
+
+
+AVRO_SCHEMA = {"fields": [{"name": "userid", "type": "long"}], "name": "Root", "type": "record"}
+
+
+@pytest.fixture
+def registry_server(http_server):
+    _configure_http_session(http_server.url, HttpSettings(retries=0))
+    subjects = {"entity.user.user_events": {1: AVRO_SCHEMA}}
+
+    def respond(request):
+        _, _, subject, _, version = request["path"].split("/")
+        versions = subjects.get(subject, {})
+        version = max(versions) if version == "latest" and versions else int(version) if version.isdigit() else None
+        if version not in versions:
+            return 404, "application/json", b'{"error_code": 40401}'
+        body = {"subject": subject, "version": version, "id": version, "schema": json.dumps(versions[version])}
+        return 200, "application/vnd.schemaregistry.v1+json", json.dumps(body).encode("utf-8")
+
+    http_server.respond = respond
+    http_server.subjects = subjects
+    return http_server
+
+
+def test_get_schema_cached_on_disk(registry_server, tmp_path: Path):
+    registry = KafkaSchemaRegistry(registry_server.url, cache_dir=str(tmp_path))
+    assert json.loads(registry.get_schema("entity.user.user_events")) == AVRO_SCHEMA
+    assert registry_server.requests[0]["path"] == "/subjects/entity.user.user_events/versions/latest"
+
+    # a new process finds the latest version and the version it resolved to on disk
+    registry = KafkaSchemaRegistry(registry_server.url, cache_dir=str(tmp_path))
+    assert json.loads(registry.get_schema("entity.user.user_events")) == AVRO_SCHEMA
+    assert json.loads(registry.get_schema("entity.user.user_events", 1)) == AVRO_SCHEMA
+    assert len(registry_server.requests) == 1
+
+    assert registry.get_schema("missing") is None
+
+
+def test_get_schema_revalidates_latest(registry_server, tmp_path: Path):
+    registry = KafkaSchemaRegistry(registry_server.url, cache_dir=str(tmp_path), ttl_seconds=0)
+    registry.get_schema("entity.user.user_events")
+    new_schema = {**AVRO_SCHEMA, "fields": AVRO_SCHEMA["fields"] + [{"name": "home_id", "type": "int"}]}
+    registry_server.subjects["entity.user.user_events"][2] = new_schema
+
+    assert json.loads(registry.get_schema("entity.user.user_events")) == new_schema
+    # registered versions are never revalidated
+    assert json.loads(registry.get_schema("entity.user.user_events", 1)) == AVRO_SCHEMA
+    assert len(registry_server.requests) == 2
+
+
+def test_get_schema_serves_stale_schema_on_registry_errors(registry_server, tmp_path: Path):
+    registry = KafkaSchemaRegistry(registry_server.url, cache_dir=str(tmp_path), ttl_seconds=0)
+    registry.get_schema("entity.user.user_events")
+    registry_server.respond = lambda request: (500, "text/plain", b"boom")
+
+    assert json.loads(registry.get_schema("entity.user.user_events")) == AVRO_SCHEMA
+    with pytest.raises(SchemaRegistryError, match="code=500"):
+        registry.get_schema("entity.user.user_profile")
+
+
+def test_catalog_with_kafka_schema_registry(registry_server, tmp_path: Path):
+    catalog = {
+        "metadata": {
+            "hierarchical_catalog": True,
+            "data_schema": {
+                "kafka_schema_registry": registry_server.url,
+                "kafka_schema_registry_cache_dir": str(tmp_path / "schemas"),
+                "kafka_schema_registry_subject": "{canonical_name}",
+            },
+        },
+        "entity": {
+            "user": {
+                "user_events": {
+                    "driver": "dal",
+                    "args": {"default": "serving", "storage": {"serving": "dal-online://https://fs.net#userid"}},
+                }
+            }
+        },
+    }
+    path = tmp_path / "catalog.yaml"
+    path.write_text(yaml.dump(catalog))
+
+    for _ in range(2):
+        ds = DalCatalog(str(path)).entity.user.user_events()
+        assert ds.discover()["dtype"] == {"userid": "int64"}
+        assert ds.avro_schema == AVRO_SCHEMA
+    assert len(registry_server.requests) == 1
+
+
+def test_catalog_schema_of_latest_version_expires(registry_server, tmp_path: Path):
+    catalog = {
+        "metadata": {
+            "hierarchical_catalog": True,
+            "data_schema": {
+                "kafka_schema_registry": registry_server.url,
+                "kafka_schema_registry_cache_dir": str(tmp_path / "schemas"),
+                "kafka_schema_registry_ttl_seconds": 0,
+            },
+        },
+        "entity": {
+            "user": {
+                "user_events": {
+                    "driver": "dal",
+                    "args": {"default": "serving", "storage": {"serving": "dal-online://https://fs.net#userid"}},
+                }
+            }
+        },
+    }
+    path = tmp_path / "catalog.yaml"
+    path.write_text(yaml.dump(catalog))
+    cat = DalCatalog(str(path))
+    assert cat.entity.user.user_events().discover()["dtype"] == {"userid": "int64"}
+
+    new_schema = {**AVRO_SCHEMA, "fields": AVRO_SCHEMA["fields"] + [{"name": "home_id", "type": "int"}]}
+    registry_server.subjects["entity.user.user_events"][2] = new_schema
+    # the catalog didn't change, the latest version did
+    assert cat.entity.user.user_events().avro_schema == new_schema
+
+    # registered versions are memoized until the catalog changes
+    catalog["metadata"]["data_schema"]["kafka_schema_registry_versions"] = {"entity.user.user_events": 1}
+    path.write_text(yaml.dump(catalog))
+    cat = DalCatalog(str(path))
+    assert cat.entity.user.user_events().avro_schema == AVRO_SCHEMA
+    requests = len(registry_server.requests)
+    registry_server.subjects["entity.user.user_events"][1] = new_schema
+    assert cat.entity.user.user_events().avro_schema == AVRO_SCHEMA
+    assert len(registry_server.requests) == requests
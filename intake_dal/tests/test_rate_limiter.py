@@ -0,0 +1,40 @@
+import threading
+import time
+
+import pytest
+
+from intake_dal.rate_limiter import RateLimiter, TokenBucket
+
+
+def test_token_bucket_reserve():
+    bucket = TokenBucket(rate=10, capacity=2)
+    assert bucket.reserve(1) == 0
+    assert bucket.reserve(1) == 0
+    # the bucket is empty, the next token is ~100ms away
+    assert bucket.reserve(1) == pytest.approx(0.1, abs=0.02)
+
+    with pytest.raises(ValueError):
+        TokenBucket(rate=0)
+
+
+def test_rate_limiter_requests_per_second():
+    limiter = RateLimiter(requests_per_second=50, requests_burst=1)
+    begin = time.monotonic()
+    for _ in range(6):
+        limiter.acquire()
+    # first request is free, the following 5 are paced 20ms apart
+    assert time.monotonic() - begin >= 0.09
+
+
+def test_rate_limiter_rows_per_second_shared_across_threads():
+    limiter = RateLimiter(rows_per_second=100)
+    begin = time.monotonic()
+
+    threads = [threading.Thread(target=limiter.acquire, args=(50,)) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    # 200 rows with a burst of 100 rows at 100 rows/sec
+    assert time.monotonic() - begin >= 0.9
@@ -0,0 +1,144 @@
+import shutil
+from pathlib import Path
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from intake_dal.dal_catalog import DalCatalog
+from intake_dal.sync import Manifest, main, sync
+
+
+@pytest.fixture
+def tmp_catalog_path(tmp_path: Path, catalog_path: str) -> str:
+    shutil.copy(catalog_path, tmp_path)
+    shutil.copytree(Path(catalog_path).parent / "data", tmp_path / "data")
+    return str(tmp_path / "catalog.yaml")
+
+
+@mock.patch("intake_dal.dal_online._http_put_avro_data_set")
+def test_sync_writes_only_changed_rows(put_mock, tmp_catalog_path: str, tmp_path: Path):
+    cat = DalCatalog(tmp_catalog_path)
+    manifest_path = str(tmp_path / "manifest.parquet")
+
+    result = sync(cat, "entity.user.user_events", "local", "serving", manifest_path=manifest_path)
+    assert (result.rows_read, result.rows_written) == (2, 2)
+    assert put_mock.call_count == 1
+    assert Manifest.load(manifest_path).hashes.index.tolist() == ["42", "39"]
+
+    # nothing changed, nothing is posted
+    put_mock.reset_mock()
+    result = sync(cat, "entity.user.user_events", "local", "serving", manifest_path=manifest_path)
+    assert (result.rows_read, result.rows_written) == (2, 0)
+    assert put_mock.call_count == 0
+
+    # one updated and one new row
+    csv_path = tmp_path / "data" / "user_events.csv"
+    csv_path.write_text("userid,home_id,action\n42,101,home_view\n39,43,home_view\n7,1,home_view\n")
+    result = sync(cat, "entity.user.user_events", "local", "serving", manifest_path=manifest_path)
+    assert (result.rows_read, result.rows_written) == (3, 2)
+    assert put_mock.call_count == 1
+    posted = put_mock.call_args[0][1]
+    assert posted["data_set_name"] == "entity.user.user_events"
+    assert posted["key_value"] == "userid"
+
+
+@mock.patch("intake_dal.dal_online._http_put_avro_data_set", side_effect=IOError("unavailable"))
+def test_sync_failed_write_keeps_manifest(put_mock, tmp_catalog_path: str, tmp_path: Path):
+    cat = DalCatalog(tmp_catalog_path)
+    manifest_path = str(tmp_path / "manifest.parquet")
+
+    with pytest.raises(IOError):
+        sync(cat, "entity.user.user_events", "local", "serving", manifest_path=manifest_path)
+    assert len(Manifest.load(manifest_path).hashes) == 0
+
+
+def test_manifest_changed():
+    manifest = Manifest(pd.Index(["a", "b", "a"]), np.array([1, 2, 3], dtype="uint64"))
+    assert manifest.hashes.to_dict() == {"b": 2, "a": 3}
+    changed = manifest.changed(pd.Index(["a", "b", "c"]), np.array([3, 5, 1], dtype="uint64"))
+    assert changed.tolist() == [False, True, True]
+
+
+@mock.patch("intake_dal.dal_online._http_put_avro_data_set")
+def test_main(put_mock, tmp_catalog_path: str, tmp_path: Path, capsys):
+    manifest_path = str(tmp_path / "manifest.parquet")
+    args = [tmp_catalog_path, "entity.user.user_events", "--source", "local", "--manifest", manifest_path]
+
+    assert main(args).rows_written == 2
+    assert main(args).rows_written == 0
+    assert "read 2 rows, wrote 0 rows" in capsys.readouterr().out
+
+
+@mock.patch("intake_dal.dal_online._http_put_avro_data_set")
+def test_sync_duplicate_keys(put_mock, tmp_catalog_path: str, tmp_path: Path):
+    cat = DalCatalog(tmp_catalog_path)
+    manifest_path = str(tmp_path / "manifest.parquet")
+    csv_path = tmp_path / "data" / "user_events.csv"
+    csv_path.write_text("userid,home_id,action\n42,101,home_view\n42,101,home_save\n39,43,home_view\n")
+
+    result = sync(cat, "entity.user.user_events", "local", "serving", manifest_path=manifest_path)
+    # the last row of a key is the one the target keeps
+    assert (result.rows_read, result.rows_written) == (3, 2)
+
+    put_mock.reset_mock()
+    result = sync(cat, "entity.user.user_events", "local", "serving", manifest_path=manifest_path)
+    assert (result.rows_read, result.rows_written) == (3, 0)
+    assert put_mock.call_count == 0
+
+    csv_path.write_text("userid,home_id,action\n42,101,home_view\n42,101,home_buy\n39,43,home_view\n")
+    result = sync(cat, "entity.user.user_events", "local", "serving", manifest_path=manifest_path)
+    assert (result.rows_read, result.rows_written) == (3, 1)
+
+
+def test_sync_duplicate_keys_across_chunks(tmp_catalog_path: str, tmp_path: Path):
+    cat = DalCatalog(tmp_catalog_path)
+    manifest_path = str(tmp_path / "manifest.parquet")
+    chunks = [
+        pd.DataFrame({"userid": [42, 39], "action": ["view", "view"]}),
+        pd.DataFrame({"userid": [42], "action": ["save"]}),
+    ]
+    written = []
+
+    def write_chunked(frames):
+        for frame in frames:
+            written.extend(frame.to_dict("records"))
+
+    def sync_chunks():
+        with mock.patch(
+            "intake_dal.dal_source.DalSource.read_chunked", side_effect=lambda: iter(chunks)
+        ), mock.patch("intake_dal.dal_source.DalSource.write_chunked", side_effect=write_chunked):
+            return sync(cat, "entity.user.user_events", "local", "serving", manifest_path=manifest_path)
+
+    # only the last row of 42 is written
+    result = sync_chunks()
+    assert written == [{"userid": 39, "action": "view"}, {"userid": 42, "action": "save"}]
+    assert (result.rows_read, result.rows_written) == (3, 2)
+
+    # nothing changed, the key in both chunks isn't written again
+    written.clear()
+    assert sync_chunks().rows_written == 0
+    assert written == []
+
+    # 42 changed in the first chunk only, the target keeps the second chunk row
+    chunks[0] = pd.DataFrame({"userid": [42, 39], "action": ["click", "view"]})
+    assert sync_chunks().rows_written == 0
+
+    chunks[1] = pd.DataFrame({"userid": [42], "action": ["buy"]})
+    assert sync_chunks().rows_written == 1
+    assert written == [{"userid": 42, "action": "buy"}]
+
+
+@mock.patch("intake_dal.dal_online._http_put_avro_data_set")
+def test_sync_default_manifest_path(put_mock, tmp_catalog_path: str, tmp_path: Path, catalog_path: str):
+    with mock.patch("intake_dal.sync.DEFAULT_MANIFEST_DIR", tmp_path / "manifests"):
+        result = sync(DalCatalog(tmp_catalog_path), "entity.user.user_events", "local", "serving")
+        assert sync(DalCatalog(tmp_catalog_path), "entity.user.user_events", "local", "serving").rows_written == 0
+
+        # the same storage modes of another catalog have their own manifest
+        other = sync(DalCatalog(catalog_path), "entity.user.user_events", "local", "serving", key_name="userid")
+    assert other.rows_written == 2
+    assert Path(result.manifest_path).parent == tmp_path / "manifests"
+    assert Path(result.manifest_path).name.startswith("entity.user.user_events.local.serving.")
+    assert result.manifest_path != other.manifest_path
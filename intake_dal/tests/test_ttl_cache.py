@@ -0,0 +1,40 @@
+import time
+
+from intake_dal.ttl_cache import TTLCache
+
+
+def test_ttl_cache_lru_eviction():
+    cache = TTLCache(max_entries=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1  # "b" is now the least recently used
+    cache.put("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert cache.info() == {"hits": 3, "misses": 1, "evictions": 1, "entries": 2, "bytes": 0}
+
+
+def test_ttl_cache_expiry_and_invalidate():
+    cache = TTLCache(ttl_seconds=0.05)
+    cache.put("a", {})
+    cache.put("b", {"x": 1})
+    assert cache.get("a") == {}
+    cache.invalidate(["b", "missing"])
+    assert cache.get("b") is None
+
+    time.sleep(0.06)
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+def test_ttl_cache_max_bytes():
+    cache = TTLCache(max_bytes=100, sizeof=len)
+    cache.put("a", "x" * 60)
+    cache.put("b", "y" * 30)
+    assert cache.info()["bytes"] == 90
+    cache.put("c", "z" * 30)
+
+    assert cache.get("a") is None
+    assert cache.info()["bytes"] == 60